@@ -0,0 +1,144 @@
+"""
+Analytics rollups: per-user scores, per-question correct rates, per-(user, concept)
+mastery and per-file totals.
+
+submit_test calls record_submission in its own transaction with the change it just
+made, as deltas against the test's previous answers, so a resubmit moves counts
+instead of adding to them. Every counter write is an ON CONFLICT increment, so concurrent
+submissions can't lose updates; a user's last score (and best, after a resubmit, which can
+lower it) is re-read from their tests under the user_stats row lock. backfill() rebuilds
+everything from tests and answers.
+
+    python -m app.analytics.rollups backfill
+"""
+import asyncio
+import sys
+from datetime import datetime
+from sqlalchemy import select, delete, insert, update, func, case, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import (Answer, Test, Question, Concept, UserStats, QuestionStats, ConceptMastery,
+                           FileStats)
+from app.db.upsert import insert_for, chunked
+
+def _increment(s: AsyncSession, model, rows: list[dict], keys: list[str], counters: list[str]):
+    stmt = insert_for(s, model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in counters},
+    )
+
+def _submitted():
+    return select(Answer.test_id).where(Answer.test_id == Test.id).exists()
+
+def _last_test(user_id) -> dict:
+    """last_score/last_test_at as subqueries over the user's latest submitted test."""
+    last = (select(Test.score, Test.test_date).where(Test.user_id == user_id, _submitted())
+            .order_by(Test.test_date.desc(), Test.id.desc()).limit(1))
+    return {"last_score": last.with_only_columns(Test.score).scalar_subquery(),
+            "last_test_at": last.with_only_columns(Test.test_date).scalar_subquery()}
+
+async def record_submission(s: AsyncSession, *, user_id: str, test_date: datetime,
+                            previous: dict[str, bool], graded: dict[str, bool],
+                            old_score: float, new_score: float) -> None:
+    """
+    `previous` and `graded` map question id -> is_correct before and for this submission;
+    `old_score` is the test's score before it (ignored on a first submission).
+    """
+    deltas = {}
+    for qid, ok in graded.items():
+        d_attempts = 0 if qid in previous else 1
+        d_correct = int(ok) - int(previous.get(qid, False))
+        if d_attempts or d_correct:
+            deltas[qid] = (d_attempts, d_correct)
+    first = not previous
+    if not deltas and not (first and graded):
+        return
+
+    where = {}
+    for batch in chunked(sorted(deltas)):
+        where.update({r.id: r for r in await s.execute(
+            select(Question.id, Question.concept_id, Concept.file_id)
+            .join(Concept, Concept.id == Question.concept_id)
+            .where(Question.id.in_(batch))
+        )})
+    by_concept: dict[str, list[int]] = {}
+    by_file: dict[str, list[int]] = {}
+    q_rows = []
+    # sorted keys so concurrent submissions take row locks in the same order
+    for qid in sorted(deltas):
+        if qid not in where:
+            continue
+        a, c = deltas[qid]
+        q_rows.append({"question_id": qid, "file_id": where[qid].file_id, "attempts": a, "correct": c})
+        for acc in (by_concept.setdefault(where[qid].concept_id, [0, 0]), by_file.setdefault(where[qid].file_id, [0, 0])):
+            acc[0] += a
+            acc[1] += c
+
+    counters = ["attempts", "correct"]
+    for batch in chunked(q_rows):
+        await s.execute(_increment(s, QuestionStats, batch, ["question_id"], counters))
+    if by_concept:
+        rows = [{"user_id": user_id, "concept_id": k, "attempts": v[0], "correct": v[1]} for k, v in sorted(by_concept.items())]
+        await s.execute(_increment(s, ConceptMastery, rows, ["user_id", "concept_id"], counters))
+    if by_file:
+        rows = [{"file_id": k, "attempts": v[0], "correct": v[1]} for k, v in sorted(by_file.items())]
+        await s.execute(_increment(s, FileStats, rows, ["file_id"], counters))
+
+    stmt = insert_for(s, UserStats).values(
+        user_id=user_id, tests_taken=int(first), score_sum=new_score - (0.0 if first else old_score),
+        best_score=new_score, last_score=new_score, last_test_at=test_date,
+    )
+    await s.execute(stmt.on_conflict_do_update(index_elements=["user_id"], set_={
+        "tests_taken": UserStats.tests_taken + stmt.excluded.tests_taken,
+        "score_sum": UserStats.score_sum + stmt.excluded.score_sum,
+        "best_score": case((stmt.excluded.best_score > UserStats.best_score, stmt.excluded.best_score),
+                           else_=UserStats.best_score),
+    }))
+    # this test may be older than the user's latest, and a resubmit may have lowered their best
+    values = _last_test(user_id)
+    if not first:
+        values["best_score"] = (select(func.max(Test.score))
+                                .where(Test.user_id == user_id, _submitted()).scalar_subquery())
+    await s.execute(update(UserStats).where(UserStats.user_id == user_id).values(**values))
+
+async def backfill() -> dict:
+    """Recomputes every rollup from tests and answers in one transaction."""
+    async with SessionLocal() as s:
+        if s.bind.dialect.name == "postgresql":
+            # no submissions land between the wipe and the re-aggregation
+            await s.execute(text("LOCK TABLE answers IN SHARE MODE"))
+        for model in (QuestionStats, ConceptMastery, FileStats, UserStats):
+            await s.execute(delete(model))
+
+        answered = (select(Answer.question_id, Answer.test_id, Answer.is_correct, Question.concept_id,
+                           Concept.file_id, Test.user_id)
+                    .join(Question, Question.id == Answer.question_id)
+                    .join(Concept, Concept.id == Question.concept_id)
+                    .join(Test, Test.id == Answer.test_id)).subquery()
+        a = answered.c
+        n_correct = func.sum(case((a.is_correct.is_(True), 1), else_=0))
+        await s.execute(insert(QuestionStats).from_select(
+            ["question_id", "file_id", "attempts", "correct"],
+            select(a.question_id, a.file_id, func.count(), n_correct).group_by(a.question_id, a.file_id)))
+        await s.execute(insert(ConceptMastery).from_select(
+            ["user_id", "concept_id", "attempts", "correct"],
+            select(a.user_id, a.concept_id, func.count(), n_correct).group_by(a.user_id, a.concept_id)))
+        await s.execute(insert(FileStats).from_select(
+            ["file_id", "attempts", "correct"],
+            select(a.file_id, func.count(), n_correct).group_by(a.file_id)))
+
+        await s.execute(insert(UserStats).from_select(
+            ["user_id", "tests_taken", "score_sum", "best_score"],
+            select(Test.user_id, func.count(), func.sum(Test.score), func.max(Test.score))
+            .where(_submitted()).group_by(Test.user_id)))
+        await s.execute(UserStats.__table__.update().values(**_last_test(UserStats.user_id)))
+        counts = {m.__tablename__: (await s.execute(select(func.count()).select_from(m))).scalar_one()
+                  for m in (UserStats, QuestionStats, ConceptMastery, FileStats)}
+        await s.commit()
+    return counts
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m app.analytics.rollups backfill")
+    print(asyncio.run(backfill()))
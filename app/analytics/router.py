@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_session
+from app.db.pagination import encode_cursor, decode_cursor, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from app.db.models import (Test, Answer, Concept, Question, UploadedFile, UserStats, QuestionStats,
+                           ConceptMastery, FileStats)
+from app.deps import get_current_user, CurrentUser
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# every endpoint reads rollup rows by key; nothing here aggregates answers
+
+def _rate(correct: int, attempts: int) -> float | None:
+    return round(correct / attempts, 4) if attempts else None
+
+async def _own_file(s: AsyncSession, file_id: str, user: CurrentUser) -> None:
+    owner = (await s.execute(select(UploadedFile.user_id).where(UploadedFile.id == file_id))).scalar_one_or_none()
+    if owner != user.id:
+        raise HTTPException(404, "file not found")
+
+@router.get("/me")
+async def my_stats(history: int = Query(20, ge=0, le=200), user: CurrentUser = Depends(get_current_user),
+                   s: AsyncSession = Depends(get_session)):
+    st = await s.get(UserStats, user.id)
+    recent = []
+    if history:
+        # newest submitted tests, walking idx_tests_user_created_id
+        submitted = select(Answer.test_id).where(Answer.test_id == Test.id).exists()
+        recent = (await s.execute(
+            select(Test.id, Test.test_date, Test.score)
+            .where(Test.user_id == user.id, submitted)
+            .order_by(Test.created_at.desc(), Test.id.desc()).limit(history)
+        )).all()
+    return {
+        "tests_taken": st.tests_taken if st else 0,
+        "average_score": st.score_sum / st.tests_taken if st and st.tests_taken else None,
+        "best_score": st.best_score if st else None,
+        "last_score": st.last_score if st else None,
+        "last_test_at": st.last_test_at.isoformat() if st and st.last_test_at else None,
+        "history": [{"test_id": t.id, "date": t.test_date.isoformat(), "score": t.score} for t in recent],
+    }
+
+@router.get("/me/concepts")
+async def my_concepts(file_id: str | None = None, user: CurrentUser = Depends(get_current_user),
+                      s: AsyncSession = Depends(get_session)):
+    q = (select(ConceptMastery.concept_id, Concept.keyword, Concept.file_id, ConceptMastery.attempts,
+                ConceptMastery.correct)
+         .join(Concept, Concept.id == ConceptMastery.concept_id)
+         .where(ConceptMastery.user_id == user.id))
+    if file_id:
+        q = q.where(Concept.file_id == file_id)
+    rows = (await s.execute(q.order_by(Concept.file_id, Concept.keyword))).all()
+    return {"items": [{"concept_id": r.concept_id, "keyword": r.keyword, "file_id": r.file_id,
+                       "attempts": r.attempts, "correct": r.correct, "mastery": _rate(r.correct, r.attempts)}
+                      for r in rows]}
+
+@router.get("/files/{file_id}")
+async def file_stats(file_id: str, cursor: str | None = None,
+                     limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                     user: CurrentUser = Depends(get_current_user), s: AsyncSession = Depends(get_session)):
+    """For the uploader: overall and per-question correct rates of tests drawn from the file,
+    the questions a page at a time (keyset on question id)."""
+    await _own_file(s, file_id, user)
+    st = await s.get(FileStats, file_id)
+    q = (select(QuestionStats.question_id, Question.question_text, QuestionStats.attempts, QuestionStats.correct)
+         .join(Question, Question.id == QuestionStats.question_id)
+         .where(QuestionStats.file_id == file_id))
+    if cursor:
+        (after,) = decode_cursor(cursor, str)
+        q = q.where(QuestionStats.question_id > after)
+    rows = (await s.execute(q.order_by(QuestionStats.question_id).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].question_id)
+    return {
+        "file_id": file_id,
+        "attempts": st.attempts if st else 0,
+        "correct": st.correct if st else 0,
+        "correct_rate": _rate(st.correct, st.attempts) if st else None,
+        "questions": [{"question_id": r.question_id, "question_text": r.question_text, "attempts": r.attempts,
+                       "correct": r.correct, "correct_rate": _rate(r.correct, r.attempts)} for r in rows],
+        "next_cursor": next_cursor,
+    }
+
+@router.get("/questions/{question_id}")
+async def question_stats(question_id: str, user: CurrentUser = Depends(get_current_user),
+                         s: AsyncSession = Depends(get_session)):
+    # ownership first, so another user's question (or a missing one) is the same 404
+    # whether or not it has answers
+    file_id = (await s.execute(
+        select(Concept.file_id).join(Question, Question.concept_id == Concept.id).where(Question.id == question_id)
+    )).scalar_one_or_none()
+    await _own_file(s, file_id, user)
+    st = await s.get(QuestionStats, question_id)
+    if st is None:
+        raise HTTPException(404, "no answers recorded for this question")
+    return {"question_id": question_id, "attempts": st.attempts, "correct": st.correct,
+            "correct_rate": _rate(st.correct, st.attempts)}
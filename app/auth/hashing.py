@@ -0,0 +1,71 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from .security import hash_password, verify_password, needs_rehash
+
+# bcrypt releases the GIL, so a small thread pool keeps the event loop free
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+# calls allowed in flight + queued before new ones are rejected
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "2"))
+
+class HashPoolBusy(Exception):
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER):
+        super().__init__("password hashing pool is saturated")
+        self.retry_after = retry_after
+
+class HashPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending = 0  # only touched from the event loop thread
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HashPoolBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(self._pending, self.workers),
+            "queued": max(self._pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+pool = HashPool(HASH_WORKERS, HASH_MAX_PENDING)
+
+async def hash_password_async(pw: str) -> str:
+    return await pool.run(hash_password, pw)
+
+def _verify_and_update(pw: str, hashed: str) -> tuple[bool, str | None]:
+    # runs in the worker: verification and the optional rehash share one slot
+    if not verify_password(pw, hashed):
+        return False, None
+    return True, (hash_password(pw) if needs_rehash(hashed) else None)
+
+async def verify_and_update_async(pw: str, hashed: str) -> tuple[bool, str | None]:
+    """Returns (ok, new_hash); new_hash is set when the stored hash uses a stale cost factor."""
+    return await pool.run(_verify_and_update, pw, hashed)
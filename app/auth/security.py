@@ -5,8 +5,12 @@ from passlib.hash import bcrypt
 SECRET = os.getenv("JWT_SECRET", "change_me")
 ALG = os.getenv("JWT_ALG", "HS256")
 EXPIRE_MIN = int(os.getenv("ACCESS_TOKEN_EXPIRE_MIN", "30"))
-def hash_password(pw: str) -> str: return bcrypt.hash(pw)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# hashes with any other cost factor are flagged by needs_rehash() and upgraded on login
+_bcrypt = bcrypt.using(rounds=BCRYPT_ROUNDS, min_desired_rounds=BCRYPT_ROUNDS, max_desired_rounds=BCRYPT_ROUNDS)
+def hash_password(pw: str) -> str: return _bcrypt.hash(pw)
 def verify_password(pw: str, hashed: str) -> bool: return bcrypt.verify(pw, hashed)
+def needs_rehash(hashed: str) -> bool: return _bcrypt.needs_update(hashed)
 def create_access_token(sub: str) -> str:
     exp = datetime.utcnow() + timedelta(minutes=EXPIRE_MIN)
     return jwt.encode({"sub": sub, "exp": exp}, SECRET, algorithm=ALG)
@@ -0,0 +1,91 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import event
+from app.db.models import User
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# upper bound on staleness for changes made by other worker processes
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    id: str
+    email: str
+    name: str
+    created_at: datetime | None
+
+    @classmethod
+    def from_user(cls, u: User) -> "CurrentUser":
+        return cls(id=u.id, email=u.email, name=u.name, created_at=u.created_at)
+
+class TokenCache:
+    """LRU of verified tokens -> (expires_at, claims, user snapshot), each entry capped by the token's exp."""
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict, CurrentUser]] = OrderedDict()
+        self._by_user: dict[str, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> CurrentUser | None:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.time():
+            self._drop(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, token: str, claims: dict, user: CurrentUser) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if claims.get("exp"):
+            expires_at = min(expires_at, float(claims["exp"]))
+        if token in self._entries:
+            self._drop(token)
+        self._entries[token] = (expires_at, claims, user)
+        self._by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        for token in self._by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _drop(self, token: str) -> None:
+        _, _, user = self._entries.pop(token)
+        tokens = self._by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user.id]
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def invalidate_user(user_id: str) -> None:
+    cache.invalidate_user(user_id)
+
+# ORM-level changes to a user drop their cached tokens in this process
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User) -> None:
+    cache.invalidate_user(target.id)
@@ -1,7 +1,8 @@
 from datetime import datetime
 from uuid import uuid4
 import enum
-from sqlalchemy import String, Text, Integer, Boolean, ForeignKey, DateTime, Enum, UniqueConstraint, Index, Float
+from sqlalchemy import (String, Text, Integer, BigInteger, Boolean, ForeignKey, DateTime, Enum, UniqueConstraint, Index,
+                        Float, JSON, LargeBinary)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from .session import Base
@@ -34,6 +35,8 @@ class UploadedFile(Base):
     filename: Mapped[str] = mapped_column(String(255))
     file_path: Mapped[str] = mapped_column(String(500))
     file_type: Mapped[str] = mapped_column(String(20))   # pdf/docx/pptx/image
+    content_hash: Mapped[str | None] = mapped_column(String(64), index=True)  # sha256 of the stored bytes
+    size_bytes: Mapped[int | None] = mapped_column(Integer)
     ai_status: Mapped[str] = mapped_column(String(20), default="pending")  # pending/parsed/error
     summary: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -41,10 +44,21 @@ class UploadedFile(Base):
     user: Mapped["User"] = relationship(back_populates="files")
     concepts: Mapped[list["Concept"]] = relationship(back_populates="file", cascade="all, delete-orphan")
 
+class ParseJob(Base):
+    __tablename__ = "parse_jobs"
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued/running/done/failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class Concept(Base):
     __tablename__ = "concepts"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
-    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"))
     keyword: Mapped[str] = mapped_column(String(255), index=True)
     description: Mapped[str | None] = mapped_column(Text)
     importance: Mapped[int] = mapped_column(Integer, default=3)
@@ -52,30 +66,94 @@ class Concept(Base):
     file: Mapped["UploadedFile"] = relationship(back_populates="concepts")
     questions: Mapped[list["Question"]] = relationship(back_populates="concept", cascade="all, delete-orphan")
     __table_args__ = (
-        UniqueConstraint("file_id", name="uq_concepts_file_id"),
+        UniqueConstraint("file_id", "keyword", name="uq_concepts_file_keyword"),
     )
 
 class Question(Base):
     __tablename__ = "questions"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
-    concept_id: Mapped[str] = mapped_column(ForeignKey("concepts.id", ondelete="CASCADE"), index=True)
+    concept_id: Mapped[str] = mapped_column(ForeignKey("concepts.id", ondelete="CASCADE"))
     question_type: Mapped[QType] = mapped_column(Enum(QType))
     question_text: Mapped[str] = mapped_column(Text)
     correct_answer: Mapped[str] = mapped_column(Text)
-    options: Mapped[dict | None] = mapped_column(JSONB)  # e.g. {"A":"...", "B":"..."}
+    options: Mapped[dict | None] = mapped_column(JSON().with_variant(JSONB, "postgresql"))  # e.g. {"A":"...", "B":"..."}
     difficulty: Mapped[int] = mapped_column(Integer, default=3)
+    answer_match: Mapped[str | None] = mapped_column(String(16), nullable=True)  # short answers: exact | token_set | levenshtein
+    gen_key: Mapped[str | None] = mapped_column(String(64), nullable=True)  # "<generator>:<slot>" for generated questions
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     concept: Mapped["Concept"] = relationship(back_populates="questions")
+    __table_args__ = (
+        # a generation re-run fills missing slots instead of adding duplicates
+        UniqueConstraint("concept_id", "gen_key", name="uq_questions_concept_gen_key"),
+    )
+
+# --- near-duplicate index: MinHash signatures and LSH buckets, per file (app/questions/near_dup.py) ---
+class QuestionMinHash(Base):
+    __tablename__ = "question_minhash"
+    question_id: Mapped[str] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    signature: Mapped[bytes] = mapped_column(LargeBinary)  # NUM_PERM little-endian uint32
+    dup_group: Mapped[str] = mapped_column(String(36))      # first question of its near-duplicate cluster
+
+class QuestionLSH(Base):
+    __tablename__ = "question_lsh"
+    file_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # hash of (band, the band's rows)
+    # indexed on its own for the cascade when a question is deleted
+    question_id: Mapped[str] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued/running/done/failed
+    generator: Mapped[str] = mapped_column(String(100))
+    per_concept: Mapped[int] = mapped_column(Integer)
+    concepts_total: Mapped[int] = mapped_column(Integer, default=0)
+    concepts_done: Mapped[int] = mapped_column(Integer, default=0)
+    questions_created: Mapped[int] = mapped_column(Integer, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# a generated question dropped as a near-duplicate; its slot counts as filled on re-runs
+class SkippedGenSlot(Base):
+    __tablename__ = "skipped_gen_slots"
+    concept_id: Mapped[str] = mapped_column(ForeignKey("concepts.id", ondelete="CASCADE"), primary_key=True)
+    gen_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    dup_of: Mapped[str] = mapped_column(String(36))  # dup_group it would have joined
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# --- TF-IDF document-frequency index (one document per unique upload content) ---
+class CorpusDoc(Base):
+    __tablename__ = "corpus_docs"
+    doc_key: Mapped[str] = mapped_column(String(64), primary_key=True)  # content_hash, or file id for legacy rows
+    n_tokens: Mapped[int] = mapped_column(Integer)
+    indexed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class DocTerm(Base):
+    __tablename__ = "doc_terms"
+    doc_key: Mapped[str] = mapped_column(ForeignKey("corpus_docs.doc_key", ondelete="CASCADE"), primary_key=True)
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tf: Mapped[int] = mapped_column(Integer)
+
+class TermDF(Base):
+    __tablename__ = "term_df"
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    df: Mapped[int] = mapped_column(Integer, default=0)
 
 class Test(Base):
     __tablename__ = "tests"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
-    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     test_date: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     total_questions: Mapped[int] = mapped_column(Integer)
     correct_count: Mapped[int] = mapped_column(Integer, default=0)
     score: Mapped[float] = mapped_column(Float, default=0.0)
+    answer_match: Mapped[str | None] = mapped_column(String(16), nullable=True)  # used where the question sets none
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 class TestItem(Base):
@@ -87,10 +165,81 @@ class TestItem(Base):
 
 class Answer(Base):
     __tablename__ = "answers"
+    __table_args__ = (UniqueConstraint("test_id", "question_id", name="uq_answer_test_question"),)
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
     test_id: Mapped[str] = mapped_column(ForeignKey("tests.id", ondelete="CASCADE"), index=True)
     question_id: Mapped[str] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"), index=True)
     user_answer: Mapped[str] = mapped_column(Text)
     is_correct: Mapped[bool] = mapped_column(Boolean, default=False)
 
+# --- analytics rollups, kept current by submit_test (app/analytics/rollups.py) ---
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    tests_taken: Mapped[int] = mapped_column(Integer, default=0)   # tests with at least one answer
+    score_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    best_score: Mapped[float] = mapped_column(Float, default=0.0)
+    last_score: Mapped[float | None] = mapped_column(Float)
+    last_test_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+class QuestionStats(Base):
+    __tablename__ = "question_stats"
+    question_id: Mapped[str] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    correct: Mapped[int] = mapped_column(Integer, default=0)
+
+class ConceptMastery(Base):
+    __tablename__ = "concept_mastery"
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    concept_id: Mapped[str] = mapped_column(ForeignKey("concepts.id", ondelete="CASCADE"), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    correct: Mapped[int] = mapped_column(Integer, default=0)
+
+class FileStats(Base):
+    __tablename__ = "file_stats"
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    correct: Mapped[int] = mapped_column(Integer, default=0)
+
+# --- search index: documents and impact-ordered postings (app/search/index.py) ---
+class SearchDoc(Base):
+    __tablename__ = "search_docs"
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uid)
+    owner_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    file_id: Mapped[str] = mapped_column(ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
+    kind: Mapped[str] = mapped_column(String(16))        # file | page | concept | question
+    ref_id: Mapped[str] = mapped_column(String(36))      # id of the file, concept or question
+    page: Mapped[int | None] = mapped_column(Integer)    # 0-based page of the extracted text
+    title: Mapped[str] = mapped_column(String(255))
+    snippet: Mapped[str] = mapped_column(Text)
+
+class SearchPosting(Base):
+    __tablename__ = "search_postings"
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    doc_id: Mapped[str] = mapped_column(ForeignKey("search_docs.id", ondelete="CASCADE"), primary_key=True)
+    # copied from the doc so a term's postings can be filtered and ranked from one index
+    owner_id: Mapped[str] = mapped_column(String(36))
+    file_id: Mapped[str] = mapped_column(String(36))
+    kind: Mapped[str] = mapped_column(String(16))
+    impact: Mapped[float] = mapped_column(Float)  # BM25 term-frequency part; idf is applied at query time
+
+class SearchTerm(Base):
+    __tablename__ = "search_terms"
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    df: Mapped[int] = mapped_column(Integer, default=0)
+
 Index("idx_questions_concept_difficulty", Question.concept_id, Question.difficulty)
+# keyset pages of /questions/by-file; also serve plain file_id / concept_id lookups
+Index("idx_concepts_file_id", Concept.file_id, Concept.id)
+Index("idx_questions_concept_id", Question.concept_id, Question.id)
+Index("idx_parse_jobs_status_run_after", ParseJob.status, ParseJob.run_after)
+Index("idx_generation_jobs_status_run_after", GenerationJob.status, GenerationJob.run_after)
+# keyset pages of /tests/mine; also serves plain user_id lookups
+Index("idx_tests_user_created_id", Test.user_id, Test.created_at, Test.id)
+# a term's postings for one owner or one file, best first, carrying the /search filter columns
+# so filtered queries never visit the table; the file index also serves reindex deletes
+Index("idx_search_postings_owner_term_impact", SearchPosting.owner_id, SearchPosting.term, SearchPosting.impact,
+      SearchPosting.doc_id, SearchPosting.kind)
+Index("idx_search_postings_file_term_impact", SearchPosting.file_id, SearchPosting.term, SearchPosting.impact,
+      SearchPosting.doc_id, SearchPosting.owner_id, SearchPosting.kind)
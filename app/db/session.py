@@ -1,9 +1,42 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
+from typing import AsyncIterator
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from app import metrics
 class Base(DeclarativeBase): ...
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(DATABASE_URL, pool_pre_ping=True, echo=False)
+# size per uvicorn worker: pool_size + max_overflow connections at most
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# asyncpg prepared statement cache; set to 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+def _engine_kwargs(url: str) -> dict:
+    kw: dict = {"pool_pre_ping": True, "echo": False}
+    if url.startswith("sqlite"):
+        return kw
+    kw.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+              pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, poolclass=metrics.TimedQueuePool)
+    if "+asyncpg" in url:
+        kw["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                              "statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return kw
+
+engine = create_async_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+metrics.instrument_engine(engine)
 SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    # one session per request, shared by every dependency that asks for it.
+    # Handlers commit explicitly (teardown runs after the response is sent);
+    # anything left uncommitted is rolled back when the session closes.
+    async with SessionLocal() as s:
+        try:
+            yield s
+        except Exception:
+            await s.rollback()
+            raise
@@ -0,0 +1,16 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def insert_for(s: AsyncSession, table):
+    """
+    Dialect-specific INSERT for `table` so callers can use on_conflict_do_update /
+    on_conflict_do_nothing; both Postgres and SQLite support the same spelling.
+    """
+    if s.bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+def chunked(rows: list, size: int = 1000):
+    # keeps multi-row VALUES under driver parameter limits
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
@@ -1,8 +1,10 @@
-from fastapi import Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from jose import jwt, JWTError
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.auth.security import SECRET, ALG
-from app.db.session import SessionLocal
+from app.auth.token_cache import CurrentUser, cache as token_cache
+from app.db.session import get_session
 from app.db.models import User
 
 def _extract_bearer_token(authorization: str | None) -> str:
@@ -10,8 +12,13 @@ def _extract_bearer_token(authorization: str | None) -> str:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing or invalid Authorization header")
     return authorization.split(" ", 1)[1].strip()
 
-async def get_current_user(authorization: str | None = Header(default=None)) -> User:
+async def get_current_user(authorization: str | None = Header(default=None),
+                           s: AsyncSession = Depends(get_session)) -> CurrentUser:
     token = _extract_bearer_token(authorization)
+    # a cached token was already verified and its user loaded; skip both
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET, algorithms=[ALG])
         user_id: str = payload.get("sub")
@@ -20,8 +27,9 @@ async def get_current_user(authorization: str | None = Header(default=None)) ->
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    async with SessionLocal() as s:
-        user = (await s.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-        return user
+    user = (await s.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    current = CurrentUser.from_user(user)
+    token_cache.put(token, payload, current)
+    return current
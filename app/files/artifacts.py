@@ -0,0 +1,125 @@
+"""
+Extracted-text artifacts stored next to the upload blob.
+
+<blob>.v<parser version>.txtz holds the normalized text one zlib-compressed page
+at a time, followed by an index of page byte offsets and character offsets in the
+joined text. Readers mmap the file and decompress only the pages they touch.
+Since blobs are content-addressed, so are artifacts; a parser version bump makes
+old artifacts invisible and they are removed when the new one is written.
+"""
+from __future__ import annotations
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from typing import Iterable, Iterator
+
+MAGIC = b"LEMTXT\x00\x01"
+_TRAILER = struct.Struct("<IIQ8s")  # parser version, page count, index offset, magic
+_COMPRESS_LEVEL = 6
+
+def artifact_path(blob: Path, version: int) -> Path:
+    return blob.with_name(f"{blob.name}.v{version}.txtz")
+
+def normalize_page(text: str) -> str:
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+    return "\n".join(ln.rstrip() for ln in text.split("\n"))
+
+class TextArtifact:
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, n_pages, index_at, magic = _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"not a text artifact: {path}")
+        self.version = version
+        n = n_pages + 1
+        self._byte_offsets = struct.unpack_from(f"<{n}Q", self._mm, index_at)
+        self.char_offsets = struct.unpack_from(f"<{n}Q", self._mm, index_at + 8 * n)
+
+    def __len__(self) -> int:
+        return len(self._byte_offsets) - 1
+
+    def page(self, i: int) -> str:
+        start, stop = self._byte_offsets[i], self._byte_offsets[i + 1]
+        return zlib.decompress(self._mm[start:stop]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.page(i)
+
+    def text(self) -> str:
+        return "\n".join(self)
+
+    def page_at(self, char_pos: int) -> int:
+        """Page index holding character `char_pos` of text()."""
+        return max(bisect_right(self.char_offsets, char_pos) - 1, 0)
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self) -> "TextArtifact":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def open_artifact(blob: Path, version: int) -> TextArtifact | None:
+    path = artifact_path(blob, version)
+    if not path.exists():
+        return None
+    try:
+        return TextArtifact(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+class ArtifactWriter:
+    """Streams pages into a new artifact; it only becomes visible once complete."""
+    def __init__(self, blob: Path, version: int):
+        self.blob = blob
+        self.version = version
+        self.path = artifact_path(blob, version)
+        self._tmp = blob.with_name(f".{blob.name}.{uuid.uuid4().hex}.tmp")
+        self._f = None
+        self._byte_offsets = [0]
+        self._char_starts: list[int] = []
+        self._char_end = 0
+
+    def __enter__(self) -> "ArtifactWriter":
+        self._f = open(self._tmp, "wb")
+        return self
+
+    def write_page(self, text: str) -> None:
+        data = zlib.compress(text.encode("utf-8"), _COMPRESS_LEVEL)
+        self._f.write(data)
+        self._byte_offsets.append(self._byte_offsets[-1] + len(data))
+        # pages are joined with "\n" in text()
+        start = self._char_end + 1 if self._char_starts else 0
+        self._char_starts.append(start)
+        self._char_end = start + len(text)
+
+    def tee(self, pages: Iterable[str]) -> Iterator[str]:
+        for page in pages:
+            self.write_page(page)
+            yield page
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        f, self._f = self._f, None
+        if exc_type is not None:
+            f.close()
+            self._tmp.unlink(missing_ok=True)
+            return
+        n = len(self._byte_offsets)
+        index_at = self._byte_offsets[-1]
+        f.write(struct.pack(f"<{n}Q", *self._byte_offsets))
+        f.write(struct.pack(f"<{n}Q", *self._char_starts, self._char_end))
+        f.write(_TRAILER.pack(self.version, n - 1, index_at, MAGIC))
+        f.close()
+        os.replace(self._tmp, self.path)
+        for stale in self.blob.parent.glob(f"{self.blob.name}.v*.txtz"):
+            if stale != self.path:
+                stale.unlink(missing_ok=True)
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import ParseJob, UploadedFile
+
+PARSE_MAX_ATTEMPTS = int(os.getenv("PARSE_MAX_ATTEMPTS", "3"))
+PARSE_RETRY_DELAY = int(os.getenv("PARSE_RETRY_DELAY", "30"))     # seconds, doubled per attempt
+PARSE_JOB_TIMEOUT = int(os.getenv("PARSE_JOB_TIMEOUT", "600"))    # lease on a running job
+
+def enqueue(s: AsyncSession, file_id: str) -> ParseJob:
+    # added to the caller's transaction so the file row and its job commit together
+    job = ParseJob(file_id=file_id, status="queued", run_after=datetime.utcnow())
+    s.add(job)
+    return job
+
+async def claim_next() -> ParseJob | None:
+    async with SessionLocal() as s:
+        now = datetime.utcnow()
+        job = (await s.execute(
+            select(ParseJob)
+            .where(ParseJob.status == "queued", ParseJob.run_after <= now)
+            .order_by(ParseJob.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if job is None:
+            return None
+        # conditional update so two workers can never both win the same row
+        claimed = await s.execute(
+            update(ParseJob)
+            .where(ParseJob.id == job.id, ParseJob.status == "queued")
+            .values(status="running", attempts=ParseJob.attempts + 1, locked_at=now)
+        )
+        await s.commit()
+        if claimed.rowcount != 1:
+            return None
+        await s.refresh(job)
+        return job
+
+async def complete(job_id: str) -> None:
+    async with SessionLocal() as s:
+        await s.execute(update(ParseJob).where(ParseJob.id == job_id).values(status="done", locked_at=None))
+        await s.commit()
+
+async def fail(job_id: str, error: str) -> None:
+    async with SessionLocal() as s:
+        job = await s.get(ParseJob, job_id)
+        if job is None:
+            return
+        job.last_error = error[:2000]
+        job.locked_at = None
+        if job.attempts < PARSE_MAX_ATTEMPTS:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=PARSE_RETRY_DELAY * 2 ** (job.attempts - 1))
+            file_status = "pending"
+        else:
+            job.status = "failed"
+            file_status = "error"
+        await s.execute(update(UploadedFile).where(UploadedFile.id == job.file_id).values(ai_status=file_status))
+        await s.commit()
+
+async def recover_stuck() -> int:
+    """
+    Requeues jobs whose worker died mid-parse (lease expired) and enqueues files
+    left pending/parsing without any job, e.g. from before the queue existed.
+    """
+    async with SessionLocal() as s:
+        cutoff = datetime.utcnow() - timedelta(seconds=PARSE_JOB_TIMEOUT)
+        stale = (await s.execute(
+            select(ParseJob.file_id).where(ParseJob.status == "running", ParseJob.locked_at < cutoff)
+        )).scalars().all()
+        if stale:
+            await s.execute(
+                update(ParseJob)
+                .where(ParseJob.status == "running", ParseJob.locked_at < cutoff)
+                .values(status="queued", locked_at=None, run_after=datetime.utcnow())
+            )
+            await s.execute(update(UploadedFile).where(UploadedFile.id.in_(stale)).values(ai_status="pending"))
+        orphans = (await s.execute(
+            select(UploadedFile.id)
+            .where(UploadedFile.ai_status.in_(("pending", "parsing")),
+                   ~select(ParseJob.id).where(ParseJob.file_id == UploadedFile.id).exists())
+        )).scalars().all()
+        for file_id in orphans:
+            enqueue(s, file_id)
+        if orphans:
+            await s.execute(update(UploadedFile).where(UploadedFile.id.in_(orphans)).values(ai_status="pending"))
+        await s.commit()
+        return len(stale) + len(orphans)
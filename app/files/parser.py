@@ -1,13 +1,24 @@
 from __future__ import annotations
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import Executor, Future
 from pathlib import Path
 from collections import Counter
 import re
-from typing import Iterable
+import time
+from contextlib import closing
+from itertools import islice
+from typing import Iterable, Iterator
 import fitz  # PyMuPDF
 from docx import Document
 from sqlalchemy import select, delete
+from sqlalchemy.orm import selectinload
+from app import metrics
 from app.db.session import SessionLocal
 from app.db.models import UploadedFile, Concept, Question, QType
+from app.files import tfidf
+from app.files.artifacts import ArtifactWriter, TextArtifact, artifact_path, normalize_page, open_artifact
 from datetime import datetime
 
 STOP = set("""
@@ -19,28 +30,197 @@ day could go come did number sound no most people my over know water than call
 first who may down side been now find any new work part
 """.split())
 
-def _clean_tokens(text: str) -> Iterable[str]:
-    for w in re.findall(r"[A-Za-z][A-Za-z\-]{2,}", text.lower()):
+# bump whenever extraction or normalization changes; invalidates stored text artifacts
+PARSER_VERSION = 1
+# keep the full extracted text of each upload (see app.files.artifacts)
+TEXT_ARTIFACTS = os.getenv("TEXT_ARTIFACTS", "1") == "1"
+TOKEN_BUDGET = 20000   # tokens counted per file
+SUMMARY_CHARS = 400
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z\-]{2,}")
+_LINES_PER_CHUNK = 200  # docx paragraphs / txt lines handed on at a time
+# PDFs with at least this many pages are split across the parse process pool (0 disables)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# page ranges of one document extracted concurrently; bounds memory and wasted work on early stop
+PDF_RANGES_IN_FLIGHT = int(os.getenv("PDF_RANGES_IN_FLIGHT", str(os.cpu_count() or 2)))
+
+def _clean_tokens(text: str) -> Iterator[str]:
+    for m in _TOKEN_RE.finditer(text.lower()):
+        w = m.group()
         if w not in STOP:
             yield w
 
-def extract_text(path: Path) -> str:
+def _line_chunks(lines: Iterable[str], sep: str) -> Iterator[str]:
+    batch: list[str] = []
+    for ln in lines:
+        batch.append(ln)
+        if len(batch) >= _LINES_PER_CHUNK:
+            yield sep.join(batch)
+            batch = []
+    if batch:
+        yield sep.join(batch)
+
+def pdf_page_count(path: Path) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+def _extract_page_range(path: Path, start: int, stop: int) -> list[str]:
+    # runs in a pool process; each process opens its own handle on the document
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def iter_pdf_pages_parallel(path: Path, executor: Executor, *, pages_per_task: int = PDF_PAGES_PER_TASK,
+                            in_flight: int = PDF_RANGES_IN_FLIGHT) -> Iterator[str]:
+    """
+    Same pages as iter_pages() for a PDF, extracted in page ranges on `executor` and
+    yielded in page order. Closing the generator cancels ranges not yet started.
+    """
+    total = pdf_page_count(path)
+    ranges = iter([(i, min(i + pages_per_task, total)) for i in range(0, total, pages_per_task)])
+    pending: deque[Future] = deque()
+    try:
+        for start, stop in islice(ranges, max(in_flight, 1)):
+            pending.append(executor.submit(_extract_page_range, path, start, stop))
+        while pending:
+            pages = pending.popleft().result()
+            for start, stop in islice(ranges, 1):
+                pending.append(executor.submit(_extract_page_range, path, start, stop))
+            yield from pages
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+def iter_pages(path: Path, *, executor: Executor | None = None) -> Iterator[str]:
+    """
+    Yields the document one page (PDF) or one block of lines (docx/txt) at a time.
+    With an `executor`, large PDFs are extracted in parallel page ranges.
+    Close the generator to release the file early.
+    """
     ext = path.suffix.lower()
+    if ext == ".pdf" and executor is not None:
+        yield from iter_pdf_pages_parallel(path, executor)
+        return
     if ext == ".pdf":
-        txt = []
         with fitz.open(path) as doc:
             for page in doc:
-                txt.append(page.get_text())
-        return "\n".join(txt)
+                yield page.get_text()
+        return
     if ext == ".docx":
         doc = Document(path)
-        return "\n".join(p.text for p in doc.paragraphs)
+        yield from _line_chunks((p.text for p in doc.paragraphs), "\n")
+        return
     try:
-        return path.read_text(errors="ignore")
-    except Exception:
-        return ""
+        with open(path, errors="ignore") as f:
+            yield from _line_chunks(f, "")
+    except OSError:
+        return
+
+def extract_text(path: Path) -> str:
+    return "\n".join(iter_pages(path))
 
-async def parse_and_store(file_id: str) -> None:
+def analyze_pages(pages: Iterable[str], *, token_budget: int = TOKEN_BUDGET,
+                  summary_chars: int = SUMMARY_CHARS, timings: dict[str, float] | None = None
+                  ) -> tuple[str, Counter]:
+    """
+    One pass over the pages: collects the first non-empty lines for the summary and
+    counts the first `token_budget` tokens, then stops consuming pages. `timings`,
+    if given, accumulates seconds spent in extract (waiting for pages), tokenize and count.
+    """
+    counts: Counter = Counter()
+    n_tokens = 0
+    parts: list[str] = []
+    summary_len = -1  # length of " ".join(parts)
+    spent = {"extract": 0.0, "tokenize": 0.0, "count": 0.0}
+    clock = time.perf_counter()
+    for page in pages:
+        got_page = time.perf_counter()
+        spent["extract"] += got_page - clock
+        if summary_len < summary_chars:
+            for ln in page.splitlines():
+                ln = ln.strip()
+                if ln:
+                    parts.append(ln)
+                    summary_len += len(ln) + 1
+                    if summary_len >= summary_chars:
+                        break
+        if n_tokens < token_budget:
+            toks = list(islice(_clean_tokens(page), token_budget - n_tokens))
+            tokenized = time.perf_counter()
+            spent["tokenize"] += tokenized - got_page
+            counts.update(toks)
+            n_tokens += len(toks)
+            spent["count"] += time.perf_counter() - tokenized
+        clock = time.perf_counter()
+        if n_tokens >= token_budget and summary_len >= summary_chars:
+            break
+    if timings is not None:
+        for stage, seconds in spent.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    return " ".join(parts)[:summary_chars], counts
+
+def open_text(path: Path) -> TextArtifact | None:
+    """Cached extracted text of an upload for the current parser version, if there is one."""
+    return open_artifact(path, PARSER_VERSION)
+
+def analyze_file(path: Path, page_executor: Executor | None = None) -> tuple[str, Counter, dict[str, float]]:
+    # top-level so it can run in the parse worker's process pool; stage timings ride back with the result
+    timings: dict[str, float] = {}
+    art = open_text(path)
+    if art is not None:
+        with art:
+            return (*analyze_pages(art, timings=timings), timings)
+    with closing(iter_pages(path, executor=page_executor)) as pages:
+        normalized = map(normalize_page, pages)
+        if not TEXT_ARTIFACTS:
+            return (*analyze_pages(normalized, timings=timings), timings)
+        with ArtifactWriter(path, PARSER_VERSION) as out:
+            written = out.tee(normalized)
+            result = analyze_pages(written, timings=timings)
+            # analysis stops early; the artifact still gets the rest of the document
+            start = time.perf_counter()
+            for _ in written:
+                pass
+            timings["extract"] += time.perf_counter() - start
+        return (*result, timings)
+
+async def _analyze(path: Path, executor: Executor | None) -> tuple[str, Counter, dict[str, float]]:
+    loop = asyncio.get_running_loop()
+    if (executor is not None and PDF_PARALLEL_MIN_PAGES > 0 and path.suffix.lower() == ".pdf"
+            and not artifact_path(path, PARSER_VERSION).exists()):
+        if await loop.run_in_executor(executor, pdf_page_count, path) >= PDF_PARALLEL_MIN_PAGES:
+            # a thread drives the fan-out; the page ranges themselves run on the pool
+            return await loop.run_in_executor(None, analyze_file, path, executor)
+    return await loop.run_in_executor(executor, analyze_file, path)
+
+async def _find_parsed_twin(s, uf: UploadedFile) -> UploadedFile | None:
+    if not uf.content_hash:
+        return None
+    return (await s.execute(
+        select(UploadedFile)
+        .where(UploadedFile.content_hash == uf.content_hash,
+               UploadedFile.file_type == uf.file_type,
+               UploadedFile.ai_status == "parsed",
+               UploadedFile.id != uf.id)
+        .order_by(UploadedFile.created_at)
+        .limit(1)
+    )).scalar_one_or_none()
+
+async def _copy_parse_results(s, src: UploadedFile, dst: UploadedFile) -> None:
+    # same bytes -> same extraction; clone the rows instead of re-running the parser
+    concepts = (await s.execute(
+        select(Concept).where(Concept.file_id == src.id).options(selectinload(Concept.questions))
+    )).scalars().all()
+    for c in concepts:
+        s.add(Concept(
+            file_id=dst.id, keyword=c.keyword, description=c.description, importance=c.importance,
+            questions=[Question(question_type=q.question_type, question_text=q.question_text,
+                                correct_answer=q.correct_answer, options=q.options,
+                                difficulty=q.difficulty, created_at=datetime.utcnow())
+                       for q in c.questions],
+        ))
+    dst.summary = src.summary
+
+async def parse_and_store(file_id: str, *, executor: Executor | None = None) -> None:
     async with SessionLocal() as s:
         uf = (await s.execute(select(UploadedFile).where(UploadedFile.id == file_id))).scalar_one_or_none()
         if not uf:
@@ -49,18 +229,31 @@ async def parse_and_store(file_id: str) -> None:
             uf.ai_status = "parsing"
             await s.commit()
 
-            text = extract_text(Path(uf.file_path)).strip()
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-            summary = " ".join(lines)[:400] if lines else ""
+            twin = await _find_parsed_twin(s, uf)
+            if twin is not None:
+                await s.execute(delete(Concept).where(Concept.file_id == uf.id))
+                await _copy_parse_results(s, twin, uf)
+                uf.ai_status = "parsed"
+                await s.commit()
+                return
+            await s.commit()  # don't hold a pooled connection during extraction
 
-            tokens = list(_clean_tokens(text))[:20000]
-            common = [w for w, _ in Counter(tokens).most_common(8)]
+            # PyMuPDF/python-docx are CPU bound; never run them on the event loop
+            summary, counts, timings = await _analyze(Path(uf.file_path), executor)
+            for stage, seconds in timings.items():
+                metrics.PARSE_STAGE.observe(seconds, stage)
+
+            # concepts are the document's top TF-IDF terms against the whole corpus
+            write_start = time.perf_counter()
+            key = tfidf.doc_key(uf)
+            await tfidf.index_document(s, key, counts)
+            ranked = await tfidf.rank_terms(s, key, limit=5)
 
             await s.execute(delete(Concept).where(Concept.file_id == uf.id))
 
             concepts = []
-            for kw in common[:5]:
-                c = Concept(file_id=uf.id, keyword=kw, description=f"Key term: {kw}", importance=3)
+            for kw, importance in ranked:
+                c = Concept(file_id=uf.id, keyword=kw, description=f"Key term: {kw}", importance=importance)
                 s.add(c); concepts.append(c)
             await s.flush()
 
@@ -79,6 +272,8 @@ async def parse_and_store(file_id: str) -> None:
             uf.summary = summary or "No summary available."
             uf.ai_status = "parsed"
             await s.commit()
+            metrics.PARSE_STAGE.observe(time.perf_counter() - write_start, "db_write")
         except Exception:
-            uf.ai_status = "error"
-            await s.commit()
+            # the caller (parse worker) decides between retry and ai_status="error"
+            await s.rollback()
+            raise
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, UploadFile, File, Depends, BackgroundTasks, HTTPException
+from fastapi import APIRouter, Request, Depends, HTTPException
 from pathlib import Path
-import uuid
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.deps import get_current_user
-from app.db.session import SessionLocal
-from app.db.models import UploadedFile, User
-from app.files.parser import parse_and_store
+from app.deps import get_current_user, CurrentUser
+from app.db.session import get_session
+from app.db.models import UploadedFile
+from app.files import jobs
+from app.files.storage import receive_upload
 
 router = APIRouter(prefix="/files", tags=["files"])
 
@@ -16,42 +17,37 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 ALLOWED = {"pdf", "docx", "txt"}
 MAX_UPLOAD_MB = 10
 
-@router.post("/upload")
+# the body is parsed by receive_upload, so describe it for the docs by hand
+_UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+@router.post("/upload", openapi_extra=_UPLOAD_BODY)
 async def upload(
-    bg: BackgroundTasks,                                 # non-default first
-    file: UploadFile = File(...),
-    user: User = Depends(get_current_user),
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+    s: AsyncSession = Depends(get_session),
 ):
-    # basic validation
-    ext = (file.filename.rsplit(".", 1)[-1] if "." in file.filename else "").lower()
-    data = await file.read()
-    size_mb = len(data) / 1024 / 1024
-    if size_mb > MAX_UPLOAD_MB:
-        raise HTTPException(status_code=413, detail="File too large")
-    if ext not in ALLOWED:
-        raise HTTPException(status_code=400, detail="Unsupported file type")
-
-    # store on disk
-    name = f"{uuid.uuid4()}.{ext or 'bin'}"
-    path = UPLOAD_DIR / name
-    path.write_bytes(data)
+    # validated and written to disk chunk by chunk; nothing is buffered whole
+    stored = await receive_upload(request, UPLOAD_DIR, allowed=ALLOWED, max_bytes=MAX_UPLOAD_MB * 1024 * 1024)
 
     # DB record
-    async with SessionLocal() as s:
-        rec = UploadedFile(
-            user_id=user.id,
-            filename=file.filename,
-            file_path=str(path),
-            file_type=ext or "bin",
-            ai_status="pending",
-            summary=None,
-        )
-        s.add(rec)
-        await s.commit()
-        await s.refresh(rec)
-
-    # background parse
-    bg.add_task(parse_and_store, rec.id)
+    rec = UploadedFile(
+        user_id=user.id,
+        filename=stored.filename,
+        file_path=str(stored.path),
+        file_type=stored.ext or "bin",
+        content_hash=stored.sha256,
+        size_bytes=stored.size,
+        ai_status="pending",
+        summary=None,
+    )
+    s.add(rec)
+    await s.flush()
+    # parsed by the worker (python -m app.files.worker); committed together with the file row
+    jobs.enqueue(s, rec.id)
+    await s.commit()
 
     return {
         "file_id": rec.id,
@@ -61,11 +57,11 @@ async def upload(
     }
 
 @router.get("/{file_id}/summary")
-async def file_summary(file_id: str, user: User = Depends(get_current_user)):
-    async with SessionLocal() as s:
-        row = (
-            await s.execute(select(UploadedFile).where(UploadedFile.id == file_id))
-        ).scalar_one_or_none()
-        if not row or (row.user_id and row.user_id != user.id):
-            raise HTTPException(status_code=404, detail="file not found")
-        return {"file_id": row.id, "ai_status": row.ai_status, "summary": row.summary}
+async def file_summary(file_id: str, user: CurrentUser = Depends(get_current_user),
+                       s: AsyncSession = Depends(get_session)):
+    row = (
+        await s.execute(select(UploadedFile).where(UploadedFile.id == file_id))
+    ).scalar_one_or_none()
+    if not row or (row.user_id and row.user_id != user.id):
+        raise HTTPException(status_code=404, detail="file not found")
+    return {"file_id": row.id, "ai_status": row.ai_status, "summary": row.summary}
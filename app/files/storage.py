@@ -0,0 +1,137 @@
+from __future__ import annotations
+import hashlib
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+import anyio
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# slack for boundaries and part headers when comparing Content-Length to the file limit
+MULTIPART_OVERHEAD = 16 * 1024
+
+@dataclass
+class StoredUpload:
+    filename: str
+    ext: str
+    path: Path
+    size: int
+    sha256: str
+    deduplicated: bool = False  # identical bytes were already in the blob store
+
+def blob_path(root: Path, sha256: str, ext: str) -> Path:
+    # content-addressed: identical uploads share one file on disk
+    return root / sha256[:2] / f"{sha256}.{ext or 'bin'}"
+
+def file_ext(filename: str) -> str:
+    return (filename.rsplit(".", 1)[-1] if "." in filename else "").lower()
+
+class _UploadReceiver:
+    """Multipart callbacks that pick out one file field and validate it as it arrives."""
+    def __init__(self, field: str, allowed: set[str], max_bytes: int):
+        self.field = field
+        self.allowed = allowed
+        self.max_bytes = max_bytes
+        self.filename: str | None = None
+        self.size = 0
+        self.done = False
+        self.pending: list[bytes] = []  # file bytes from the last chunk, flushed by the caller
+        self._receiving = False
+        self._disposition = b""
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field or b"filename" not in options or self.done:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        # reject on the part headers, before any file bytes are read
+        if file_ext(filename) not in self.allowed:
+            raise HTTPException(status_code=400, detail="Unsupported file type")
+        self.filename = filename
+        self._receiving = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._receiving:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail="File too large")
+        self.pending.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._receiving:
+            self._receiving = False
+            self.done = True
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+async def receive_upload(request: Request, dest_dir: Path, *, allowed: set[str], max_bytes: int,
+                         field: str = "file") -> StoredUpload:
+    """
+    Streams the `field` file of a multipart request into the blob store under `dest_dir`,
+    hashing it on the way. Memory use is one network chunk regardless of the file size.
+    """
+    mime, params = parse_options_header(request.headers.get("content-type", ""))
+    if mime != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    receiver = _UploadReceiver(field, allowed, max_bytes)
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+    digest = hashlib.sha256()
+    tmp = dest_dir / f".{uuid.uuid4()}.part"
+    try:
+        async with await anyio.open_file(tmp, "wb") as out:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if receiver.pending:
+                    data = b"".join(receiver.pending)
+                    receiver.pending.clear()
+                    digest.update(data)
+                    await out.write(data)
+            parser.finalize()
+        if not receiver.done:
+            raise HTTPException(status_code=400, detail=f"Missing '{field}' file field")
+        ext = file_ext(receiver.filename)
+        sha256 = digest.hexdigest()
+        path = blob_path(dest_dir, sha256, ext)
+        deduplicated = await anyio.Path(path).exists()
+        if deduplicated:
+            await anyio.Path(tmp).unlink()
+        else:
+            await anyio.Path(path.parent).mkdir(parents=True, exist_ok=True)
+            await anyio.Path(tmp).rename(path)
+    except BaseException:
+        await anyio.Path(tmp).unlink(missing_ok=True)
+        raise
+    return StoredUpload(filename=receiver.filename, ext=ext, path=path, size=receiver.size,
+                        sha256=sha256, deduplicated=deduplicated)
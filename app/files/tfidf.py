@@ -0,0 +1,110 @@
+"""
+Corpus-wide TF-IDF for concept extraction.
+
+Every unique upload (by content hash) is one document. parse_and_store indexes it
+once via index_document(); term document frequencies are kept in term_df and
+updated incrementally. `python -m app.files.tfidf rescore` recomputes
+Concept.importance for the whole corpus after it has changed.
+"""
+import asyncio
+import sys
+from collections import Counter
+import numpy as np
+from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import UploadedFile, Concept, CorpusDoc, DocTerm, TermDF
+from app.db.upsert import insert_for, chunked
+
+MAX_TERM_LEN = 64
+
+def doc_key(uf: UploadedFile) -> str:
+    return uf.content_hash or uf.id
+
+def tfidf_weights(tf: np.ndarray, df: np.ndarray, n_docs: int) -> np.ndarray:
+    # sublinear tf, smoothed idf
+    return (1.0 + np.log(tf)) * (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0)
+
+def importance_levels(w: np.ndarray, w_max: np.ndarray | float) -> np.ndarray:
+    # 1..5 relative to the strongest term of the same document
+    return (1 + np.rint(4.0 * w / np.maximum(w_max, 1e-12))).astype(int)
+
+async def index_document(s: AsyncSession, key: str, counts: Counter) -> bool:
+    """Adds a document to the index; a document already indexed is left untouched."""
+    counts = {t: n for t, n in counts.items() if len(t) <= MAX_TERM_LEN}
+    inserted = (await s.execute(
+        insert_for(s, CorpusDoc)
+        .values(doc_key=key, n_tokens=sum(counts.values()))
+        .on_conflict_do_nothing(index_elements=["doc_key"])
+        .returning(CorpusDoc.doc_key)
+    )).scalar_one_or_none()
+    if inserted is None:
+        return False
+    # sorted so concurrent workers take row locks in the same order
+    terms = sorted(counts)
+    for batch in chunked(terms):
+        await s.execute(insert_for(s, DocTerm).values([{"doc_key": key, "term": t, "tf": counts[t]} for t in batch]))
+        stmt = insert_for(s, TermDF).values([{"term": t, "df": 1} for t in batch])
+        await s.execute(stmt.on_conflict_do_update(index_elements=["term"], set_={"df": TermDF.df + 1}))
+    return True
+
+async def rank_terms(s: AsyncSession, key: str, limit: int) -> list[tuple[str, int]]:
+    """Top `limit` terms of an indexed document by TF-IDF, with their 1..5 importance."""
+    n_docs = (await s.execute(select(func.count()).select_from(CorpusDoc))).scalar_one()
+    rows = (await s.execute(
+        select(DocTerm.term, DocTerm.tf, TermDF.df)
+        .join(TermDF, TermDF.term == DocTerm.term)
+        .where(DocTerm.doc_key == key)
+        .order_by(DocTerm.tf.desc(), DocTerm.term)
+    )).all()
+    if not rows:
+        return []
+    tf = np.fromiter((r.tf for r in rows), dtype=np.float64, count=len(rows))
+    df = np.fromiter((r.df for r in rows), dtype=np.float64, count=len(rows))
+    w = tfidf_weights(tf, df, n_docs)
+    top = np.argsort(-w, kind="stable")[:limit]
+    levels = importance_levels(w[top], w.max())
+    return [(rows[i].term, int(lv)) for i, lv in zip(top, levels)]
+
+async def rescore_all(batch_docs: int = 500) -> int:
+    """Recomputes Concept.importance for every file from the current corpus statistics."""
+    updated = 0
+    async with SessionLocal() as s:
+        n_docs = (await s.execute(select(func.count()).select_from(CorpusDoc))).scalar_one()
+        keys = (await s.execute(select(CorpusDoc.doc_key).order_by(CorpusDoc.doc_key))).scalars().all()
+        file_key = func.coalesce(UploadedFile.content_hash, UploadedFile.id)
+        for batch in chunked(keys, batch_docs):
+            rows = (await s.execute(
+                select(DocTerm.doc_key, DocTerm.term, DocTerm.tf, TermDF.df)
+                .join(TermDF, TermDF.term == DocTerm.term)
+                .where(DocTerm.doc_key.in_(batch))
+            )).all()
+            if not rows:
+                continue
+            key_idx = {k: i for i, k in enumerate(batch)}
+            doc = np.fromiter((key_idx[r.doc_key] for r in rows), dtype=np.int64, count=len(rows))
+            tf = np.fromiter((r.tf for r in rows), dtype=np.float64, count=len(rows))
+            df = np.fromiter((r.df for r in rows), dtype=np.float64, count=len(rows))
+            w = tfidf_weights(tf, df, n_docs)
+            w_max = np.zeros(len(batch))
+            np.maximum.at(w_max, doc, w)
+            levels = importance_levels(w, w_max[doc])
+            level_of = {(r.doc_key, r.term): int(lv) for r, lv in zip(rows, levels)}
+
+            concepts = (await s.execute(
+                select(Concept.id, Concept.keyword, file_key.label("doc_key"))
+                .join(UploadedFile, UploadedFile.id == Concept.file_id)
+                .where(file_key.in_(batch))
+            )).all()
+            params = [{"id": c.id, "importance": level_of[(c.doc_key, c.keyword)]}
+                      for c in concepts if (c.doc_key, c.keyword) in level_of]
+            if params:
+                await s.execute(update(Concept), params)
+                updated += len(params)
+            await s.commit()
+    return updated
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rescore"]:
+        sys.exit("usage: python -m app.files.tfidf rescore")
+    print(f"updated {asyncio.run(rescore_all())} concepts")
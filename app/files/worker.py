@@ -0,0 +1,107 @@
+"""
+Parse worker: python -m app.files.worker
+
+Claims jobs from parse_jobs and runs text extraction in a process pool, so
+parse load never touches the web workers' event loops. Question generation jobs
+(app.questions.generation) are claimed by the same worker and fan out over the
+same pool.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from concurrent.futures import Executor, ProcessPoolExecutor
+from app import metrics
+from app.db.session import SessionLocal
+from app.files import jobs
+from app.files.parser import parse_and_store
+from app.search import index as search_index
+from app.questions import generation, near_dup
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))  # jobs in flight = extraction processes
+PARSE_POLL_INTERVAL = float(os.getenv("PARSE_POLL_INTERVAL", "1.0"))
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "1"))  # jobs in flight; each fans out over the pool
+# standalone worker only: serve its metrics on this port (0 = off); embedded, they are on the app's /metrics
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+log = logging.getLogger("app.files.worker")
+
+async def _run_jobs(executor: Executor, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            job = await jobs.claim_next()
+        except Exception:
+            log.exception("claiming a parse job failed")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), PARSE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await parse_and_store(job.file_id, executor=executor)
+            # a failed reindex retries the job; parsing is idempotent
+            await search_index.index_file(job.file_id, executor=executor)
+            await near_dup.index_file(job.file_id)
+            if generation.QUESTION_GEN_AUTO:
+                async with SessionLocal() as s:
+                    await generation.enqueue_files(s, [job.file_id])
+                    await s.commit()
+        except Exception as e:
+            log.warning("parse job %s (file %s) failed on attempt %d: %r", job.id, job.file_id, job.attempts, e)
+            await jobs.fail(job.id, repr(e))
+        else:
+            await jobs.complete(job.id)
+
+async def _run_generation_jobs(executor: Executor, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            job = await generation.claim_next()
+        except Exception:
+            log.exception("claiming a generation job failed")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), PARSE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            created = await generation.run_job(job, executor)
+        except Exception as e:
+            log.warning("generation job %s (file %s) failed on attempt %d: %r", job.id, job.file_id, job.attempts, e)
+            await generation.fail(job.id, repr(e))
+        else:
+            log.info("generated %d questions for file %s", created, job.file_id)
+            await generation.complete(job.id)
+
+async def run_worker(stop: asyncio.Event, workers: int = PARSE_WORKERS) -> None:
+    # spawn, not fork: the parent has an event loop and DB connections
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        recovered = await jobs.recover_stuck()
+        if recovered:
+            log.info("requeued %d stuck parse jobs", recovered)
+        recovered = await generation.recover_stuck()
+        if recovered:
+            log.info("requeued %d stuck generation jobs", recovered)
+        await asyncio.gather(*(_run_jobs(executor, stop) for _ in range(workers)),
+                             *(_run_generation_jobs(executor, stop) for _ in range(GENERATION_WORKERS)))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def _main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if WORKER_METRICS_PORT:
+        await asyncio.gather(run_worker(stop), metrics.serve(WORKER_METRICS_PORT, stop))
+    else:
+        await run_worker(stop)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
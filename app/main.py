@@ -1,30 +1,73 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import metrics
+from app.auth import hashing, token_cache
+from app.db.session import engine
+from app.files.worker import run_worker
+from app.tests import sampling, grader, render_pool
 from app.auth.router import router as auth_router
 from app.files.router import router as files_router
 from app.questions.router import router as questions_router
 from app.tests.router import router as tests_router
+from app.analytics.router import router as analytics_router
+from app.search.router import router as search_router
 from app.questions.router import router as questions_router
-app = FastAPI(title="Lecture & Exam Manager API")
+
+# dev convenience: run the parse worker inside the web process instead of `python -m app.files.worker`
+PARSE_WORKER_EMBEDDED = os.getenv("PARSE_WORKER_EMBEDDED", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop = asyncio.Event()
+    worker = asyncio.create_task(run_worker(stop)) if PARSE_WORKER_EMBEDDED else None
+    yield
+    stop.set()
+    if worker is not None:
+        await worker
+    hashing.pool.shutdown()
+    render_pool.pool.shutdown()
+    await engine.dispose()
+
+app = FastAPI(title="Lecture & Exam Manager API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+@app.exception_handler(hashing.HashPoolBusy)
+async def hash_pool_busy(request: Request, exc: hashing.HashPoolBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, retry shortly"},
+                        headers={"Retry-After": str(exc.retry_after)})
+@app.exception_handler(render_pool.RenderPoolBusy)
+async def render_pool_busy(request: Request, exc: render_pool.RenderPoolBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, retry shortly"},
+                        headers={"Retry-After": str(exc.retry_after)})
 @app.get("/healthz")
-async def healthz(): return {"ok": True}
+async def healthz(): return {"ok": True, "hash_pool": hashing.pool.stats(), "token_cache": token_cache.cache.stats(),
+                             "question_pool": sampling.cache.stats(), "grading_keys": grader.cache.stats(),
+                             "render_pool": render_pool.pool.stats()}
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 app.include_router(auth_router)
 app.include_router(files_router)
 app.include_router(questions_router)
 app.include_router(tests_router)
+app.include_router(analytics_router)
+app.include_router(search_router)
 
 
 from fastapi import Depends
-from app.deps import get_current_user
-from app.db.models import User
+from app.deps import get_current_user, CurrentUser
 
 @app.get("/me")
-async def me(user: User = Depends(get_current_user)):
+async def me(user: CurrentUser = Depends(get_current_user)):
     return {
         "id": user.id,
         "email": user.email,
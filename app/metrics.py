@@ -0,0 +1,208 @@
+"""
+Process-local metrics in the Prometheus text format, served at GET /metrics.
+
+Counters and fixed-bucket histograms only: an observation is a bisect and a few
+additions under a lock, and SQL timing is two engine event hooks, cheap enough
+to leave on (METRICS_ENABLED=0 turns the middleware and hooks off). Every process
+keeps its own numbers: run one uvicorn worker per scrape target, and give the
+standalone parse worker WORKER_METRICS_PORT to scrape it too.
+
+Per request: latency by route template, and how many SQL statements the request
+ran and how long they took (a contextvar follows the request into the engine's
+event hooks). Globally: statement durations by verb, connection pool checkout
+wait, parse stages and PDF renders.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+_VERB = re.compile(r"\s*(\w+)")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{_escape(str(v))}"' for k, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._label_str(k)} {_fmt(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        out = []
+        for k, s in items:
+            cumulative = 0
+            for le, n in zip((*map(_fmt, self.buckets), "+Inf"), s):
+                cumulative += n
+                bucket = f'le="{le}"'
+                out.append(f"{self.name}_bucket{self._label_str(k, bucket)} {cumulative}")
+            out.append(f"{self.name}_sum{self._label_str(k)} {_fmt(s[-1])}")
+            out.append(f"{self.name}_count{self._label_str(k)} {cumulative}")
+        return out
+
+_REGISTRY: list[_Metric] = []
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                         ("method", "route", "status"))
+HTTP_SQL_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements run per request.",
+                                ("method", "route"), COUNT_BUCKETS)
+HTTP_SQL_SECONDS = Histogram("http_request_sql_seconds", "Time spent in SQL per request.", ("method", "route"))
+SQL_SECONDS = Histogram("db_statement_duration_seconds", "SQL statement duration by verb.", ("verb",))
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time to get a connection from the pool.")
+PARSE_STAGE = Histogram("parse_stage_seconds", "Time per parse_and_store stage.", ("stage",), SLOW_BUCKETS)
+PDF_RENDER = Histogram("pdf_render_seconds", "PDF renders, including the render pool queue.", ("kind",),
+                       SLOW_BUCKETS)
+PDF_EXPORTS = Counter("pdf_exports_total", "Test PDF requests by export cache outcome.", ("cache",))
+
+def render() -> str:
+    return "\n".join(line for m in _REGISTRY for line in m.render()) + "\n"
+
+# --- per-request SQL accounting --------------------------------------------------
+_request_sql: ContextVar[list | None] = ContextVar("request_sql", default=None)  # [statements, seconds]
+
+class MetricsMiddleware:
+    """Plain ASGI so streamed responses are timed to their last byte."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = ["500"]
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_sql.reset(token)
+            route = scope.get("route")
+            # templates, not raw paths, so ids don't explode the label set
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.observe(elapsed, method, path, status[0])
+            HTTP_SQL_STATEMENTS.observe(sql[0], method, path)
+            HTTP_SQL_SECONDS.observe(sql[1], method, path)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+    verb = _VERB.match(statement)
+    SQL_SECONDS.observe(elapsed, verb.group(1).lower() if verb else "other")
+    sql = _request_sql.get()
+    if sql is not None:
+        sql[0] += 1
+        sql[1] += elapsed
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute; drop its start time
+    starts = context.connection.info.get("metrics_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine) -> None:
+    """Hooks statement timing into an AsyncEngine."""
+    if METRICS_ENABLED:
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The async engine's default pool, also recording how long checkouts wait."""
+    def _do_get(self):
+        if not METRICS_ENABLED:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+# --- standalone processes ---------------------------------------------------------
+async def serve(port: int, stop: asyncio.Event, host: str = "0.0.0.0") -> None:
+    """Minimal HTTP endpoint answering every request with render(), until `stop` is set."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await stop.wait()
@@ -0,0 +1,244 @@
+"""
+Batch question generation.
+
+POST /questions/generate queues one GenerationJob per file, and the parse worker
+queues one after every successful parse (QUESTION_GEN_AUTO). The worker runs a job
+by fanning its concepts out over the process pool, one task per concept, and
+bulk-inserts finished concepts together, advancing the job's progress with each
+batch. Slots a concept already has are never requested again and inserts ignore
+(concept_id, gen_key) conflicts, so running a file twice only fills gaps. A new
+question that is a near-duplicate of one already in the file (app.questions.near_dup)
+is dropped, and its slot recorded in skipped_gen_slots so re-runs don't ask for it again.
+
+    python -m app.questions.generation run FILE_ID [FILE_ID ...]
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import GenerationJob, UploadedFile, Concept, Question, SkippedGenSlot, uid
+from app.db.upsert import insert_for, chunked
+from app.questions import near_dup
+from app.questions.generators import ConceptSpec, generate, load_generator
+from app.search import index as search_index
+from app.tests import sampling
+
+QUESTION_GENERATOR = os.getenv("QUESTION_GENERATOR", "template")
+QUESTIONS_PER_CONCEPT = int(os.getenv("QUESTIONS_PER_CONCEPT", "12"))
+QUESTION_GEN_AUTO = os.getenv("QUESTION_GEN_AUTO", "1") == "1"  # queue generation after every parse
+GENERATION_IN_FLIGHT = int(os.getenv("GENERATION_IN_FLIGHT", str(os.cpu_count() or 2)))  # concepts at once
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+GENERATION_RETRY_DELAY = int(os.getenv("GENERATION_RETRY_DELAY", "30"))  # seconds, doubled per attempt
+GENERATION_JOB_TIMEOUT = int(os.getenv("GENERATION_JOB_TIMEOUT", "1800"))  # lease on a running job
+_FLUSH_ROWS = 1000
+
+def progress(job: GenerationJob) -> dict:
+    return {"job_id": job.id, "file_id": job.file_id, "status": job.status, "generator": job.generator,
+            "per_concept": job.per_concept, "concepts_total": job.concepts_total,
+            "concepts_done": job.concepts_done, "questions_created": job.questions_created,
+            "progress": round(job.concepts_done / job.concepts_total, 4) if job.concepts_total else None,
+            "error": job.last_error}
+
+async def enqueue_files(s: AsyncSession, file_ids: list[str], *, per_concept: int = QUESTIONS_PER_CONCEPT,
+                        generator: str = QUESTION_GENERATOR) -> list[GenerationJob]:
+    """
+    A queued job per file; a file that already has one queued or running keeps it,
+    and a queued one is raised to `per_concept` if it asked for fewer. A running job
+    has already read its target, so it stays below `per_concept`. The caller commits.
+    """
+    active = {j.file_id: j for j in (await s.execute(
+        select(GenerationJob).where(GenerationJob.file_id.in_(file_ids),
+                                    GenerationJob.status.in_(("queued", "running")))
+    )).scalars()}
+    jobs = []
+    for file_id in dict.fromkeys(file_ids):
+        job = active.get(file_id)
+        if job is None:
+            job = GenerationJob(file_id=file_id, status="queued", generator=generator, per_concept=per_concept,
+                                concepts_total=0, concepts_done=0, questions_created=0, attempts=0,
+                                run_after=datetime.utcnow())
+            s.add(job)
+        elif job.per_concept < per_concept:
+            # conditional so a worker claiming the job meanwhile keeps the target it read
+            await s.execute(update(GenerationJob)
+                            .where(GenerationJob.id == job.id, GenerationJob.status == "queued")
+                            .values(per_concept=per_concept)
+                            .execution_options(synchronize_session=False))
+            await s.refresh(job)
+        jobs.append(job)
+    await s.flush()
+    return jobs
+
+async def _claim(s: AsyncSession, job_id: str) -> bool:
+    # conditional update so two workers can never both win the same row
+    claimed = await s.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id, GenerationJob.status == "queued")
+        .values(status="running", attempts=GenerationJob.attempts + 1, locked_at=datetime.utcnow())
+    )
+    await s.commit()
+    return claimed.rowcount == 1
+
+async def claim_next() -> GenerationJob | None:
+    async with SessionLocal() as s:
+        job = (await s.execute(
+            select(GenerationJob)
+            .where(GenerationJob.status == "queued", GenerationJob.run_after <= datetime.utcnow())
+            .order_by(GenerationJob.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if job is None or not await _claim(s, job.id):
+            return None
+        await s.refresh(job)
+        return job
+
+async def complete(job_id: str) -> None:
+    async with SessionLocal() as s:
+        await s.execute(update(GenerationJob).where(GenerationJob.id == job_id).values(status="done", locked_at=None))
+        await s.commit()
+
+async def fail(job_id: str, error: str) -> None:
+    async with SessionLocal() as s:
+        job = await s.get(GenerationJob, job_id)
+        if job is None:
+            return
+        job.last_error = error[:2000]
+        job.locked_at = None
+        if job.attempts < GENERATION_MAX_ATTEMPTS:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=GENERATION_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = "failed"
+        await s.commit()
+
+async def recover_stuck() -> int:
+    """Requeues jobs whose worker died mid-run (lease expired)."""
+    async with SessionLocal() as s:
+        cutoff = datetime.utcnow() - timedelta(seconds=GENERATION_JOB_TIMEOUT)
+        stale = await s.execute(
+            update(GenerationJob)
+            .where(GenerationJob.status == "running", GenerationJob.locked_at < cutoff)
+            .values(status="queued", locked_at=None, run_after=datetime.utcnow())
+        )
+        await s.commit()
+        return stale.rowcount
+
+async def _store(job: GenerationJob, owner_id: str | None, rows: list[dict], concepts_done: int) -> int:
+    async with SessionLocal() as s:
+        sigs = [near_dup.signature(r["question_type"], r["question_text"], r["options"], r["correct_answer"])
+                for r in rows]
+        groups = await near_dup.assign_groups(s, job.file_id, [r["id"] for r in rows], sigs)
+        keep = [i for i, r in enumerate(rows) if groups[i] == r["id"]]
+        skipped = [{"concept_id": r["concept_id"], "gen_key": r["gen_key"], "dup_of": groups[i],
+                    "created_at": r["created_at"]} for i, r in enumerate(rows) if groups[i] != r["id"]]
+        for batch in chunked(skipped):
+            await s.execute(insert_for(s, SkippedGenSlot).values(batch).on_conflict_do_nothing())
+        rows = [rows[i] for i in keep]
+        sig_of = {rows[n]["id"]: sigs[i] for n, i in enumerate(keep)}
+        created = []
+        for batch in chunked(rows):
+            stmt = (insert_for(s, Question).values(batch)
+                    .on_conflict_do_nothing(index_elements=["concept_id", "gen_key"])
+                    .returning(Question.id))
+            created += (await s.execute(stmt)).scalars().all()
+        await near_dup.store(s, job.file_id, created, [sig_of[q] for q in created], created)
+        if owner_id and created:
+            by_id = {r["id"]: r for r in rows}
+            docs = [search_index.question_doc(Question(**by_id[qid])) for qid in created]
+            await search_index.add_docs(s, owner_id, job.file_id, docs)
+        await s.execute(update(GenerationJob).where(GenerationJob.id == job.id).values(
+            concepts_done=GenerationJob.concepts_done + concepts_done,
+            questions_created=GenerationJob.questions_created + len(created),
+        ))
+        await s.commit()
+    return len(created)
+
+async def run_job(job: GenerationJob, executor: Executor | None = None) -> int:
+    """Generates the missing questions of a claimed job's file; returns how many were inserted."""
+    prefix = f"{load_generator(job.generator).name}:"
+    async with SessionLocal() as s:
+        owner_id = (await s.execute(
+            select(UploadedFile.user_id).where(UploadedFile.id == job.file_id)
+        )).scalar_one_or_none()
+        concepts = (await s.execute(
+            select(Concept.id, Concept.keyword, Concept.description, Concept.importance)
+            .where(Concept.file_id == job.file_id).order_by(Concept.id)
+        )).all()
+        filled: dict[str, set[int]] = defaultdict(set)
+        # slots with a question, and slots whose question was dropped as a near-duplicate
+        taken = [select(m.concept_id, m.gen_key).join(Concept, Concept.id == m.concept_id)
+                 .where(Concept.file_id == job.file_id, m.gen_key.startswith(prefix))
+                 for m in (Question, SkippedGenSlot)]
+        for concept_id, key in await s.execute(union_all(*taken)):
+            slot = key[len(prefix):]
+            if slot.isdigit():
+                filled[concept_id].add(int(slot))
+        keywords = tuple(c.keyword for c in concepts)
+        todo = []
+        for c in concepts:
+            slots = [i for i in range(job.per_concept) if i not in filled[c.id]]
+            if slots:
+                todo.append((ConceptSpec(c.id, c.keyword, c.description, c.importance, keywords), slots))
+        await s.execute(update(GenerationJob).where(GenerationJob.id == job.id).values(
+            concepts_total=len(concepts), concepts_done=len(concepts) - len(todo)))
+        await s.commit()
+
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(GENERATION_IN_FLIGHT)
+    async def one(spec: ConceptSpec, slots: list[int]):
+        async with limit:
+            return spec, slots, await loop.run_in_executor(executor, generate, job.generator, spec, slots)
+    tasks = [asyncio.create_task(one(spec, slots)) for spec, slots in todo]
+    created, rows, finished = 0, [], 0
+    try:
+        for fut in asyncio.as_completed(tasks):
+            spec, slots, questions = await fut
+            now = datetime.utcnow()
+            rows += [{"id": uid(), "concept_id": spec.id, "question_type": q.question_type,
+                      "question_text": q.question_text, "correct_answer": q.correct_answer,
+                      "options": q.options, "difficulty": q.difficulty, "gen_key": f"{prefix}{slot}",
+                      "created_at": now} for slot, q in zip(slots, questions)]
+            finished += 1
+            if len(rows) >= _FLUSH_ROWS:
+                created += await _store(job, owner_id, rows, finished)
+                rows, finished = [], 0
+        if rows or finished:
+            created += await _store(job, owner_id, rows, finished)
+    finally:
+        for t in tasks:
+            t.cancel()
+    if created:
+        sampling.invalidate(job.file_id)
+    return created
+
+async def run_files(file_ids: list[str], per_concept: int = QUESTIONS_PER_CONCEPT) -> dict[str, int]:
+    """Generates for the given files in this process, skipping files a worker is already on."""
+    async with SessionLocal() as s:
+        jobs = await enqueue_files(s, file_ids, per_concept=per_concept)
+        await s.commit()
+        out = {}
+        for job in jobs:
+            if not await _claim(s, job.id):
+                continue
+            try:
+                out[job.file_id] = await run_job(job)
+            except Exception as e:
+                await fail(job.id, repr(e))
+                raise
+            await complete(job.id)
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog="python -m app.questions.generation")
+    ap.add_argument("command", choices=["run"])
+    ap.add_argument("file_ids", nargs="+")
+    ap.add_argument("--per-concept", type=int, default=QUESTIONS_PER_CONCEPT)
+    args = ap.parse_args()
+    for file_id, n in asyncio.run(run_files(args.file_ids, args.per_concept)).items():
+        print(f"{file_id}: {n} questions")
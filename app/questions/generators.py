@@ -0,0 +1,89 @@
+"""
+Question generators for the batch pipeline (app.questions.generation).
+
+A generator turns one concept into questions for the requested slots. Question
+`slot` of a concept is stored with gen_key "<generator name>:<slot>", so a re-run
+only asks for slots that are still empty. Generators run in the parse worker's
+process pool and are looked up by QUESTION_GENERATOR in each process: a name
+registered in GENERATORS, or "module:attr" naming a generator class or instance.
+"""
+from __future__ import annotations
+import functools
+import importlib
+import random
+import re
+from dataclasses import dataclass
+from typing import Protocol, Sequence
+from app.db.models import QType
+
+@dataclass(frozen=True, slots=True)
+class ConceptSpec:
+    id: str
+    keyword: str
+    description: str | None
+    importance: int
+    others: tuple[str, ...]  # the file's other keywords, for distractors
+
+@dataclass(frozen=True, slots=True)
+class GeneratedQuestion:
+    question_type: QType
+    question_text: str
+    correct_answer: str
+    options: dict[str, str] | None
+    difficulty: int
+
+class QuestionGenerator(Protocol):
+    name: str
+
+    def generate(self, concept: ConceptSpec, slots: Sequence[int]) -> list[GeneratedQuestion]:
+        """One question per slot, in slot order."""
+        ...
+
+_MCQ_STEMS = ("Which term is described by: {d}?", "Pick the key term for: {d}", "{d} — which term is this?")
+_SHORT_STEMS = ("Which key term is this? {d}", "Name the term: {d}", "Fill in the blank: {d}")
+
+class TemplateGenerator:
+    """
+    Local, deterministic generator: the same concept and slot always give the same
+    question. Slots cycle through MCQ, O/X and short answer.
+    """
+    name = "template"
+
+    def generate(self, concept: ConceptSpec, slots: Sequence[int]) -> list[GeneratedQuestion]:
+        return [self._one(concept, slot) for slot in slots]
+
+    def _one(self, c: ConceptSpec, slot: int) -> GeneratedQuestion:
+        rng = random.Random(f"{c.id}:{slot}")
+        desc = c.description or c.keyword
+        blanked = re.sub(re.escape(c.keyword), "_____", desc, flags=re.IGNORECASE)
+        others = sorted(set(c.others) - {c.keyword})
+        difficulty = min(max(6 - c.importance + slot % 2, 1), 5)
+        variant = slot // 3 % 3
+        if slot % 3 == 0 and len(others) >= 3:
+            choices = [c.keyword, *rng.sample(others, 3)]
+            rng.shuffle(choices)
+            return GeneratedQuestion(QType.mcq, _MCQ_STEMS[variant].format(d=blanked), c.keyword,
+                                     dict(zip("ABCD", choices)), difficulty)
+        if slot % 3 != 2:
+            swap = bool(others) and rng.random() < 0.5
+            term = rng.choice(others) if swap else c.keyword
+            return GeneratedQuestion(QType.ox, f'O or X: "{term}" is the term described by: {blanked}',
+                                     "X" if swap else "O", None, difficulty)
+        return GeneratedQuestion(QType.short, _SHORT_STEMS[variant].format(d=blanked), c.keyword, None, difficulty)
+
+GENERATORS: dict[str, type] = {"template": TemplateGenerator}
+
+@functools.cache
+def load_generator(spec: str) -> QuestionGenerator:
+    if spec in GENERATORS:
+        return GENERATORS[spec]()
+    module, _, attr = spec.partition(":")
+    obj = getattr(importlib.import_module(module), attr)
+    return obj() if isinstance(obj, type) else obj
+
+def generate(spec: str, concept: ConceptSpec, slots: list[int]) -> list[GeneratedQuestion]:
+    # top-level so it can run in a pool process
+    out = load_generator(spec).generate(concept, slots)
+    if len(out) != len(slots):
+        raise ValueError(f"generator {spec!r} returned {len(out)} questions for {len(slots)} slots")
+    return out
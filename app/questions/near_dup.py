@@ -0,0 +1,174 @@
+"""
+Near-duplicate questions via MinHash/LSH.
+
+A question's text and options (lowercased, punctuation dropped) are cut into
+character SHINGLE-grams and summarized by a NUM_PERM-value MinHash signature, half
+over the text and half over the distractors, so a stem reused with different
+distractors only counts half. The fraction of equal values between two signatures
+estimates the Jaccard similarity of their shingle sets. Shingles are hashed with the
+question type and correct answer as a seed, so questions differing in either share
+nothing: an O/X statement with the opposite answer, or one MCQ stem with two
+different keys, is never a duplicate however alike they read.
+
+Signatures are split into BANDS bands whose hashes go into question_lsh, scoped to
+the file, so finding the candidates for a new question is one primary-key range
+scan however large the bank is. Candidates at or above NEAR_DUP_THRESHOLD join the
+best match's dup_group; anything else starts its own.
+
+Generation drops questions that would join an existing group, and create_test can
+draw at most one question per group (`distinct`). Other inserts are signed by
+index_file, which the parse worker runs after each parse.
+
+    python -m app.questions.near_dup backfill
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import zlib
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import Question, Concept, QuestionMinHash, QuestionLSH
+from app.db.upsert import insert_for, chunked
+
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NUM_PERM = 64
+BANDS = 16        # 16 bands x 4 rows: pairs near 0.5 Jaccard already become candidates
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+_MERSENNE = np.uint64((1 << 61) - 1)
+# fixed seed: signatures are stored, so the permutations must never change
+_perm = np.random.default_rng(20261018)
+_A = _perm.integers(1, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+_B = _perm.integers(0, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+_NON_WORD = re.compile(r"[\W_]+")
+
+def _normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+def shingles(text: str) -> set[bytes]:
+    norm = _normalize(text).encode()
+    if len(norm) <= SHINGLE:
+        return {norm}
+    return {norm[i:i + SHINGLE] for i in range(len(norm) - SHINGLE + 1)}
+
+def _minhash(shingle_set: set[bytes], seed: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    h = np.fromiter((zlib.crc32(sh, seed) for sh in shingle_set), dtype=np.uint64)
+    # (a*h + b) mod p per permutation; uint64 wraparound is part of the hash
+    return (((h[:, None] * a + b) % _MERSENNE) & np.uint64(0xFFFFFFFF)).min(axis=0)
+
+def signature(question_type, question_text: str, options: dict | None, correct_answer: str | None) -> np.ndarray:
+    """The options half is over the distractors, or the text again for questions without options."""
+    options = options or {}
+    # an MCQ key may be a letter or the option text; compare by the text either way
+    answer = options.get(correct_answer, correct_answer) or ""
+    seed = zlib.crc32(f"{getattr(question_type, 'value', question_type)}\0{_normalize(str(answer))}".encode())
+    text = shingles(question_text)
+    # the key is in the seed already; option order doesn't matter, a reshuffled MCQ is the same question
+    distractors = [str(v) for v in options.values() if v != answer]
+    opts = set().union(*map(shingles, distractors)) if distractors else text
+    half = NUM_PERM // 2
+    return np.concatenate([_minhash(text, seed, _A[:half], _B[:half]),
+                           _minhash(opts, seed, _A[half:], _B[half:])]).astype("<u4")
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def band_keys(sig: np.ndarray) -> list[int]:
+    # the band number is hashed in, so one bigint both names the band and matches it
+    return [int.from_bytes(hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8,
+                                           salt=band.to_bytes(16, "little")).digest(), "little", signed=True)
+            for band in range(BANDS)]
+
+async def assign_groups(s: AsyncSession, file_id: str, ids: list[str], sigs: list[np.ndarray]) -> list[str]:
+    """
+    dup_group of each new question: that of its most similar match at or above the
+    threshold, among the file's indexed questions and the earlier new ones, else its own id.
+    """
+    keys = [band_keys(sig) for sig in sigs]
+    candidates: list[set[str]] = [set() for _ in ids]
+    for batch in chunked(list(range(len(ids))), 100):
+        where: dict[int, list[int]] = {}
+        for i in batch:
+            for k in keys[i]:
+                where.setdefault(k, []).append(i)
+        rows = await s.execute(
+            select(QuestionLSH.bucket, QuestionLSH.question_id)
+            .where(QuestionLSH.file_id == file_id, QuestionLSH.bucket.in_(list(where)))
+        )
+        for bucket, qid in rows:
+            for i in where[bucket]:
+                candidates[i].add(qid)
+    known: dict[str, tuple[np.ndarray, str]] = {}
+    for batch in chunked(sorted(set().union(*candidates))):
+        for qid, blob, group in await s.execute(
+            select(QuestionMinHash.question_id, QuestionMinHash.signature, QuestionMinHash.dup_group)
+            .where(QuestionMinHash.question_id.in_(batch))
+        ):
+            known[qid] = (np.frombuffer(blob, dtype="<u4"), group)
+
+    groups: list[str] = []
+    local: dict[int, list[int]] = {}
+    for i, (qid, sig) in enumerate(zip(ids, sigs)):
+        best, group = NEAR_DUP_THRESHOLD, qid
+        for c in candidates[i]:
+            if c in known and (sim := similarity(sig, known[c][0])) >= best:
+                best, group = sim, known[c][1]
+        for j in {j for k in keys[i] for j in local.get(k, ())}:
+            if (sim := similarity(sig, sigs[j])) >= best:
+                best, group = sim, groups[j]
+        groups.append(group)
+        for k in keys[i]:
+            local.setdefault(k, []).append(i)
+    return groups
+
+async def store(s: AsyncSession, file_id: str, ids: list[str], sigs: list[np.ndarray], groups: list[str]) -> None:
+    rows = [{"question_id": q, "file_id": file_id, "signature": sig.tobytes(), "dup_group": g}
+            for q, sig, g in zip(ids, sigs, groups)]
+    buckets = [{"file_id": file_id, "bucket": bucket, "question_id": q}
+               for q, sig in zip(ids, sigs) for bucket in band_keys(sig)]
+    # executemany rather than multi-row VALUES: BANDS rows per question, one cached statement
+    if rows:
+        await s.execute(insert_for(s, QuestionMinHash).on_conflict_do_nothing(), rows)
+        await s.execute(insert_for(s, QuestionLSH).on_conflict_do_nothing(), buckets)
+
+async def index_questions(s: AsyncSession, file_id: str, questions: list) -> list[str]:
+    """
+    Signs and indexes questions of one file (anything with id, question_type, question_text,
+    options and correct_answer); returns their dup_groups. The caller commits.
+    """
+    ids = [q.id for q in questions]
+    sigs = [signature(q.question_type, q.question_text, q.options, q.correct_answer) for q in questions]
+    groups = await assign_groups(s, file_id, ids, sigs)
+    await store(s, file_id, ids, sigs, groups)
+    return groups
+
+async def index_file(file_id: str) -> int:
+    """Indexes the file's questions that have no signature yet (parse results, copies)."""
+    async with SessionLocal() as s:
+        rows = (await s.execute(
+            select(Question.id, Question.question_type, Question.question_text, Question.options,
+                   Question.correct_answer)
+            .join(Concept, Concept.id == Question.concept_id)
+            .outerjoin(QuestionMinHash, QuestionMinHash.question_id == Question.id)
+            .where(Concept.file_id == file_id, QuestionMinHash.question_id.is_(None))
+            .order_by(Question.created_at, Question.id)
+        )).all()
+        for batch in chunked(rows):
+            await index_questions(s, file_id, batch)
+        await s.commit()
+    return len(rows)
+
+async def backfill() -> int:
+    async with SessionLocal() as s:
+        file_ids = (await s.execute(select(Concept.file_id).distinct().order_by(Concept.file_id))).scalars().all()
+    return sum([await index_file(f) for f in file_ids])
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m app.questions.near_dup backfill")
+    print(f"indexed {asyncio.run(backfill())} questions")
@@ -1,50 +1,127 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 from sqlalchemy import select
-from app.db.session import SessionLocal
-from app.db.models import Concept, Question, UploadedFile, QType
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_session
+from app.db.pagination import encode_cursor, decode_cursor, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from app.db.models import Concept, Question, UploadedFile, QType, GenerationJob
+from app.deps import get_current_user, CurrentUser
+from app.questions import generation, near_dup
+from app.tests import sampling
+from app.search import index as search_index
 from datetime import datetime
 
 router = APIRouter(prefix="/questions", tags=["questions"])
 
+class GenerateIn(BaseModel):
+    file_ids: list[str] = Field(min_length=1, max_length=100)
+    per_concept: int = Field(generation.QUESTIONS_PER_CONCEPT, ge=1, le=100)  # target per concept, not extra
+
+@router.post("/generate", status_code=202)
+async def generate_batch(body: GenerateIn, user: CurrentUser = Depends(get_current_user),
+                         s: AsyncSession = Depends(get_session)):
+    """
+    Queues question generation for your files; the parse worker runs it. A job
+    already running for a file keeps its own per_concept; it is returned with
+    applied=false, and you can post again once it finishes.
+    """
+    owned = set((await s.execute(
+        select(UploadedFile.id).where(UploadedFile.id.in_(body.file_ids), UploadedFile.user_id == user.id)
+    )).scalars())
+    if missing := [f for f in body.file_ids if f not in owned]:
+        raise HTTPException(404, f"file not found: {missing[0]}")
+    jobs = await generation.enqueue_files(s, body.file_ids, per_concept=body.per_concept)
+    await s.commit()
+    return {"jobs": [{**generation.progress(j), "applied": j.per_concept >= body.per_concept} for j in jobs]}
+
+@router.get("/generate/progress")
+async def generation_progress(file_id: list[str] = Query(..., max_length=100),
+                              user: CurrentUser = Depends(get_current_user), s: AsyncSession = Depends(get_session)):
+    """Latest generation job of each of your files."""
+    rows = (await s.execute(
+        select(GenerationJob)
+        .join(UploadedFile, UploadedFile.id == GenerationJob.file_id)
+        .where(GenerationJob.file_id.in_(file_id), UploadedFile.user_id == user.id)
+        .order_by(GenerationJob.created_at.desc())
+    )).scalars().all()
+    latest = {}
+    for job in rows:
+        latest.setdefault(job.file_id, job)
+    return {"jobs": [generation.progress(latest[f]) for f in dict.fromkeys(file_id) if f in latest]}
+
 @router.post("/generate/{file_id}")
-async def generate_questions(file_id: str):
-    async with SessionLocal() as s:
-        file = (await s.execute(select(UploadedFile).where(UploadedFile.id == file_id))).scalar_one_or_none()
-        if not file:
-            raise HTTPException(404, "file not found")
-        concept = (await s.execute(select(Concept).where(Concept.file_id == file_id))).scalar_one_or_none()
-        if not concept:
-            concept = Concept(file_id=file_id, keyword="demo", description="demo concept", importance=3)
-            s.add(concept)
-            await s.flush()
-        q = Question(
-            concept_id=concept.id,
-            question_type=QType.mcq,
-            question_text="What is 2 + 2?",
-            correct_answer="4",
-            options={"A":"3","B":"4","C":"5","D":"22"},
-            difficulty=1,
-            created_at=datetime.utcnow(),
-        )
-        s.add(q)
-        await s.commit()
-        return {"status":"ok","file_id":file_id,"concept_id":concept.id,"question_id":q.id}
+async def generate_questions(file_id: str, s: AsyncSession = Depends(get_session)):
+    file = (await s.execute(select(UploadedFile).where(UploadedFile.id == file_id))).scalar_one_or_none()
+    if not file:
+        raise HTTPException(404, "file not found")
+    concept = (await s.execute(
+        select(Concept).where(Concept.file_id == file_id).order_by(Concept.importance.desc()).limit(1)
+    )).scalar_one_or_none()
+    docs = []
+    if not concept:
+        concept = Concept(file_id=file_id, keyword="demo", description="demo concept", importance=3)
+        s.add(concept)
+        await s.flush()
+        docs.append(search_index.DocText("concept", concept.id, None, concept.keyword, concept.description,
+                                         search_index.term_counts(concept.keyword, concept.description)))
+    q = Question(
+        concept_id=concept.id,
+        question_type=QType.mcq,
+        question_text="What is 2 + 2?",
+        correct_answer="4",
+        options={"A":"3","B":"4","C":"5","D":"22"},
+        difficulty=1,
+        created_at=datetime.utcnow(),
+    )
+    s.add(q)
+    await s.flush()
+    await near_dup.index_questions(s, file_id, [q])
+    if file.user_id:
+        await search_index.add_docs(s, file.user_id, file_id, docs + [search_index.question_doc(q)])
+    await s.commit()
+    sampling.invalidate(file_id)
+    return {"status":"ok","file_id":file_id,"concept_id":concept.id,"question_id":q.id}
 
 @router.get("/by-file/{file_id}")
-async def list_by_file(file_id: str):
-    async with SessionLocal() as s:
-        result = await s.execute(
-            select(Concept, Question)
-            .join(Question, Question.concept_id == Concept.id, isouter=True)
-            .where(Concept.file_id == file_id)
-        )
-        items = []
-        for c, q in result.all():
-            items.append({
-                "concept_id": c.id,
-                "keyword": c.keyword,
-                "question_id": getattr(q, "id", None) if q else None,
-                "question_text": getattr(q, "question_text", None) if q else None,
-                "difficulty": getattr(q, "difficulty", None) if q else None,
-            })
-        return {"items": items}
+async def list_by_file(file_id: str, cursor: str | None = None,
+                       limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                       s: AsyncSession = Depends(get_session)):
+    """
+    The file's questions in (concept id, question id) order; a concept without questions
+    gets one row with a null question. Concepts and each concept's questions are read as
+    separate range scans (idx_concepts_file_id, idx_questions_concept_id), so a page costs
+    the same however large the file's bank is.
+    """
+    items: list[dict] = []
+    async def add_questions(concept_id: str, after: str | None) -> int:
+        q = (select(Question.concept_id, Concept.keyword, Question.id.label("question_id"), Question.question_text,
+                    Question.difficulty)
+             .join(Concept, Concept.id == Question.concept_id)
+             .where(Question.concept_id == concept_id, Concept.file_id == file_id))
+        if after is not None:
+            q = q.where(Question.id > after)
+        rows = (await s.execute(q.order_by(Question.id).limit(limit + 1 - len(items)))).all()
+        items.extend(r._asdict() for r in rows)
+        return len(rows)
+
+    concepts = select(Concept.id, Concept.keyword).where(Concept.file_id == file_id)
+    if cursor:
+        # '' marks a concept emitted without questions
+        concept_id, question_id = decode_cursor(cursor, str, str)
+        await add_questions(concept_id, question_id)
+        concepts = concepts.where(Concept.id > concept_id)
+    # every concept yields at least one row, so this many concepts always fill the page
+    more = []
+    if len(items) <= limit:
+        more = (await s.execute(concepts.order_by(Concept.id).limit(limit + 1 - len(items)))).all()
+    for c in more:
+        if len(items) > limit:
+            break
+        if not await add_questions(c.id, None):
+            items.append({"concept_id": c.id, "keyword": c.keyword, "question_id": None,
+                          "question_text": None, "difficulty": None})
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["concept_id"], items[-1]["question_id"] or "")
+    return {"items": items, "next_cursor": next_cursor}
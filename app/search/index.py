@@ -0,0 +1,251 @@
+"""
+Inverted index behind /search.
+
+Everything searchable is a SearchDoc owned by the file's uploader: the file itself
+(filename and summary), each page of its extracted text, its concepts and its
+questions. Postings store the BM25 term-frequency part of a term's score (its
+"impact"); idf comes from search_terms at query time. Since idf is the same for
+every posting of a term, reading postings from (owner_id, term, impact) in impact
+order gives each term's best documents first, and a query returns at most
+SEARCH_DEPTH postings per term however many documents the user has. Filters are
+checked on index entries: a file_id filter reads from (file_id, term, impact) and
+stays that cheap, while a kind filter also steps over the index entries of other
+kinds on the way.
+
+The parse worker reindexes a file after every parse; question generation indexes
+new questions as they are created.
+
+    python -m app.search.index rebuild
+"""
+from __future__ import annotations
+import asyncio
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NamedTuple
+from sqlalchemy import select, delete, insert, func, bindparam, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import UploadedFile, Concept, Question, SearchDoc, SearchPosting, SearchTerm, uid
+from app.db.upsert import insert_for, chunked
+from app.files.parser import STOP, open_text
+
+SEARCH_DEPTH = int(os.getenv("SEARCH_DEPTH", "1000"))  # postings read per query term
+SEARCH_MAX_TERMS = 8
+SEARCH_STATS_TTL = 60  # seconds the corpus size used for idf may lag
+SNIPPET_CHARS = 200
+MAX_TERM_LEN = 64
+TITLE_WEIGHT = 2
+BM25_K1, BM25_B = 1.2, 0.75
+_AVG_LEN = {"file": 60, "page": 400, "concept": 12, "question": 30}  # typical document length in tokens
+_WORD = re.compile(r"[^\W_]{2,}")
+
+def tokenize(text: str | None) -> list[str]:
+    return [w for w in _WORD.findall((text or "").lower()) if w not in STOP and len(w) <= MAX_TERM_LEN]
+
+def term_counts(title: str | None, body: str | None) -> Counter:
+    counts = Counter(tokenize(body))
+    for t in tokenize(title):
+        counts[t] += TITLE_WEIGHT
+    return counts
+
+def impacts(counts: Counter, kind: str) -> dict[str, float]:
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(counts.values()) / _AVG_LEN[kind])
+    return {t: tf * (BM25_K1 + 1) / (tf + norm) for t, tf in counts.items()}
+
+def highlight(text: str, terms: list[str], width: int = SNIPPET_CHARS) -> str:
+    """About `width` characters of `text` around the first query term found in it."""
+    low = text.lower()
+    pos = min((i for i in (low.find(t) for t in terms) if i >= 0), default=0)
+    start = max(pos - width // 3, 0)
+    return " ".join(text[start:start + width].split())
+
+class DocText(NamedTuple):
+    kind: str
+    ref_id: str
+    page: int | None
+    title: str
+    snippet: str
+    terms: Counter
+
+def page_terms(path: Path) -> list[tuple[int, Counter, str]]:
+    # runs in the parse pool; pages come from the text artifact written by the parse
+    art = open_text(path)
+    if art is None:
+        return []
+    with art:
+        out = []
+        for i, text in enumerate(art):
+            counts = Counter(tokenize(text))
+            if counts:
+                out.append((i, counts, " ".join(text[:SNIPPET_CHARS].split())))
+        return out
+
+def question_doc(q) -> DocText:
+    opts = " ".join(str(v) for v in q.options.values()) if isinstance(q.options, dict) else ""
+    return DocText("question", q.id, None, q.question_text[:255], q.question_text[:SNIPPET_CHARS],
+                   term_counts(q.question_text, opts))
+
+async def add_docs(s: AsyncSession, owner_id: str, file_id: str, docs: list[DocText]) -> int:
+    rows, postings, df = [], [], Counter()
+    for d in docs:
+        if not d.terms:
+            continue
+        doc_id = uid()
+        rows.append({"id": doc_id, "owner_id": owner_id, "file_id": file_id, "kind": d.kind, "ref_id": d.ref_id,
+                     "page": d.page, "title": d.title[:255], "snippet": d.snippet})
+        for term, impact in impacts(d.terms, d.kind).items():
+            postings.append({"term": term, "doc_id": doc_id, "owner_id": owner_id, "file_id": file_id,
+                             "kind": d.kind, "impact": impact})
+        df.update(d.terms.keys())
+    for batch in chunked(rows):
+        await s.execute(insert(SearchDoc).values(batch))
+    for batch in chunked(postings):
+        await s.execute(insert(SearchPosting).values(batch))
+    # sorted so concurrent writers take row locks in the same order
+    for batch in chunked(sorted(df)):
+        stmt = insert_for(s, SearchTerm).values([{"term": t, "df": df[t]} for t in batch])
+        await s.execute(stmt.on_conflict_do_update(index_elements=["term"], set_={"df": SearchTerm.df + stmt.excluded.df}))
+    return len(rows)
+
+async def remove_file(s: AsyncSession, file_id: str) -> None:
+    gone = (await s.execute(
+        select(SearchPosting.term, func.count().label("n"))
+        .where(SearchPosting.file_id == file_id)
+        .group_by(SearchPosting.term).order_by(SearchPosting.term)
+    )).all()
+    dec = SearchTerm.__table__.update().where(SearchTerm.term == bindparam("t")).values(df=SearchTerm.df - bindparam("n"))
+    for batch in chunked([{"t": r.term, "n": r.n} for r in gone]):
+        await s.execute(dec, batch)
+    await s.execute(delete(SearchPosting).where(SearchPosting.file_id == file_id))
+    await s.execute(delete(SearchDoc).where(SearchDoc.file_id == file_id))
+
+async def index_file(file_id: str, *, executor: Executor | None = None) -> int:
+    """Replaces the search docs of one file; returns how many were indexed."""
+    async with SessionLocal() as s:
+        uf = await s.get(UploadedFile, file_id)
+        if uf is None:
+            return 0
+        await s.commit()  # don't hold a pooled connection while pages are tokenized
+        pages = []
+        if uf.user_id is not None:
+            pages = await asyncio.get_running_loop().run_in_executor(executor, page_terms, Path(uf.file_path))
+        concepts = (await s.execute(
+            select(Concept.id, Concept.keyword, Concept.description).where(Concept.file_id == file_id)
+        )).all()
+        questions = (await s.execute(
+            select(Question.id, Question.question_text, Question.options)
+            .join(Concept, Concept.id == Question.concept_id)
+            .where(Concept.file_id == file_id)
+        )).all()
+        await remove_file(s, file_id)
+        n = 0
+        if uf.user_id is not None:
+            docs = [DocText("file", uf.id, None, uf.filename, (uf.summary or "")[:SNIPPET_CHARS],
+                            term_counts(uf.filename, uf.summary))]
+            docs += [DocText("page", uf.id, i, f"{uf.filename} p.{i + 1}", snippet, counts)
+                     for i, counts, snippet in pages]
+            docs += [DocText("concept", c.id, None, c.keyword, (c.description or "")[:SNIPPET_CHARS],
+                             term_counts(c.keyword, c.description)) for c in concepts]
+            docs += [question_doc(q) for q in questions]
+            n = await add_docs(s, uf.user_id, file_id, docs)
+        await s.commit()
+    return n
+
+# --- queries --------------------------------------------------------------------
+_n_docs = (0.0, 0)  # (expires, count)
+
+async def doc_count(s: AsyncSession) -> int:
+    global _n_docs
+    if _n_docs[0] <= time.monotonic():
+        n = (await s.execute(select(func.count()).select_from(SearchDoc))).scalar_one()
+        _n_docs = (time.monotonic() + SEARCH_STATS_TTL, n)
+    return _n_docs[1]
+
+@dataclass(frozen=True, slots=True)
+class Hit:
+    doc_id: str
+    score: float
+
+class Ranking(NamedTuple):
+    """Corpus size and per-term df a result list was scored with; later pages reuse them."""
+    n: int
+    df: dict[str, int]
+
+def ranking_df(value) -> dict[str, int]:
+    # cursor field type for decode_cursor: bad shapes raise ValueError/TypeError
+    return {str(t): int(c) for t, c in dict(value).items()}
+
+async def search(s: AsyncSession, owner_id: str, query: str, *, kinds: list[str] | None = None,
+                 file_id: str | None = None, after: tuple[float, str] | None = None,
+                 ranking: Ranking | None = None, limit: int = 20) -> tuple[list[Hit], bool, Ranking]:
+    """
+    One page of the owner's documents ranked by BM25 for `query`, after the
+    (score, doc_id) of the previous page's last hit; also says whether more follow.
+    Scores are absolute, so a later page must pass the `ranking` its first page
+    returned: idf recomputed from df/doc counts that moved in between would shift
+    every score and the cursor would skip or repeat hits.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS]
+    if not terms:
+        return [], False, Ranking(0, {})
+    if ranking is None:
+        df = dict((await s.execute(select(SearchTerm.term, SearchTerm.df).where(SearchTerm.term.in_(terms)))).all())
+        ranking = Ranking(await doc_count(s), {t: c for t, c in df.items() if c > 0})
+    n, df = ranking
+    branches = []
+    for term in terms:
+        if df.get(term, 0) <= 0:
+            continue
+        q = select(SearchPosting.term, SearchPosting.doc_id, SearchPosting.impact).where(
+            SearchPosting.owner_id == owner_id, SearchPosting.term == term)
+        if kinds:
+            q = q.where(SearchPosting.kind.in_(kinds))
+        if file_id:
+            q = q.where(SearchPosting.file_id == file_id)
+        branches.append(select(q.order_by(SearchPosting.impact.desc()).limit(SEARCH_DEPTH).subquery()))
+    if not branches:
+        return [], False, ranking
+    idf = {t: math.log(1 + (max(n, df[t]) - df[t] + 0.5) / (df[t] + 0.5)) for t in df}
+    scores: dict[str, float] = {}
+    # every term's best postings in one round trip
+    for term, doc_id, impact in await s.execute(union_all(*branches) if len(branches) > 1 else branches[0]):
+        scores[doc_id] = scores.get(doc_id, 0.0) + idf[term] * impact
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+    if after is not None:
+        ranked = [kv for kv in ranked if (-kv[1], kv[0]) > (-after[0], after[1])]
+    return [Hit(d, sc) for d, sc in ranked[:limit]], len(ranked) > limit, ranking
+
+def page_snippets(pages: list[tuple[str, int]], terms: list[str]) -> list[str | None]:
+    """Snippets around the query for (file path, page) hits, read from the text artifacts."""
+    out: list[str | None] = []
+    opened: dict = {}
+    try:
+        for path, page in pages:
+            if path not in opened:
+                opened[path] = open_text(Path(path))
+            art = opened[path]
+            out.append(highlight(art.page(page), terms) if art is not None and page < len(art) else None)
+    finally:
+        for art in opened.values():
+            if art is not None:
+                art.close()
+    return out
+
+async def rebuild() -> int:
+    async with SessionLocal() as s:
+        file_ids = (await s.execute(
+            select(UploadedFile.id).where(UploadedFile.ai_status == "parsed").order_by(UploadedFile.id)
+        )).scalars().all()
+    return sum([await index_file(f) for f in file_ids])
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.search.index rebuild")
+    print(f"indexed {asyncio.run(rebuild())} documents")
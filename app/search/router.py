@@ -0,0 +1,48 @@
+import asyncio
+from typing import Literal
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_session
+from app.db.pagination import encode_cursor, decode_cursor, PAGE_SIZE_MAX
+from app.db.models import SearchDoc, UploadedFile
+from app.deps import get_current_user, CurrentUser
+from app.search import index
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+Kind = Literal["file", "page", "concept", "question"]
+
+@router.get("")
+async def search(q: str = Query(..., min_length=1, max_length=200), kind: list[Kind] | None = Query(None),
+                 file_id: str | None = None, cursor: str | None = None,
+                 limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+                 user: CurrentUser = Depends(get_current_user), s: AsyncSession = Depends(get_session)):
+    """Ranked search over your files, their extracted pages, concepts and questions."""
+    after, ranking = None, None
+    if cursor:
+        # the cursor carries the corpus stats page one was scored with, so scores stay comparable
+        score, doc_id, n, df = decode_cursor(cursor, float, str, int, index.ranking_df)
+        after, ranking = (score, doc_id), index.Ranking(n, df)
+    hits, more, ranking = await index.search(s, user.id, q, kinds=kind, file_id=file_id, after=after,
+                                             ranking=ranking, limit=limit)
+    rows = {d.id: (d, path) for d, path in (await s.execute(
+        select(SearchDoc, UploadedFile.file_path)
+        .join(UploadedFile, UploadedFile.id == SearchDoc.file_id)
+        .where(SearchDoc.id.in_([h.doc_id for h in hits]))
+    )).all()} if hits else {}
+    # page hits get a snippet around the match instead of the page's first lines
+    pages = [(rows[h.doc_id][1], rows[h.doc_id][0].page) for h in hits
+             if h.doc_id in rows and rows[h.doc_id][0].kind == "page"]
+    windows = iter(await asyncio.to_thread(index.page_snippets, pages, index.tokenize(q)) if pages else [])
+    items = []
+    for h in hits:
+        if h.doc_id not in rows:
+            continue  # reindexed since it was ranked
+        d = rows[h.doc_id][0]
+        snippet = (next(windows) or d.snippet) if d.kind == "page" else d.snippet
+        items.append({"kind": d.kind, "id": d.ref_id, "file_id": d.file_id,
+                      "page": d.page + 1 if d.page is not None else None,
+                      "title": d.title, "snippet": snippet, "score": round(h.score, 4)})
+    next_cursor = encode_cursor(hits[-1].score, hits[-1].doc_id, ranking.n, ranking.df) if more else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,23 +1,120 @@
-from io import BytesIO
+"""
+Test PDF rendering and the on-disk export cache.
+
+Rendered PDFs live under EXPORT_CACHE_DIR named by test id, variant and a content
+version: a hash of exactly what the render reads (question text, options, answers,
+item order) plus RENDER_VERSION. Editing a question from any process therefore
+yields a new version and a cache miss; the superseded file is removed when the new
+one is written. The version doubles as the ETag. Renders run in the render pool
+and go straight to a temp file, so neither the event loop nor the response holds
+the document.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from sqlalchemy import select
-from app.db.session import SessionLocal
-from app.db.models import Test, TestItem, Question
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import metrics
+from app.db.models import TestItem, Question
+from app.db.upsert import chunked
+from app.tests import render_pool
 
-async def build_test_pdf(test_id: str, with_answers: bool = False) -> bytes:
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    width, height = A4
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", "exports"))
+RENDER_VERSION = 1  # bump when the layout below changes
+
+PdfItem = tuple[str, dict | None, str | None]  # question text, options, correct answer
+
+@dataclass(frozen=True, slots=True)
+class CachedPdf:
+    path: Path
+    etag: str
+    size: int
+
+async def load_questions(s: AsyncSession, test_id: str) -> list[Question]:
+    # stable order so the same test always renders (and hashes) the same
+    return (await s.execute(
+        select(Question)
+        .join(TestItem, TestItem.question_id == Question.id)
+        .where(TestItem.test_id == test_id)
+        .order_by(TestItem.id)
+    )).scalars().all()
+
+def content_version(test_id: str, questions: list[Question], with_answers: bool) -> str:
+    payload = [RENDER_VERSION, test_id, with_answers,
+               [[q.id, q.question_text, q.options, q.correct_answer if with_answers else None] for q in questions]]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:32]
 
-    async with SessionLocal() as s:
-        test = (await s.execute(select(Test).where(Test.id == test_id))).scalar_one_or_none()
-        rows = (await s.execute(
-            select(TestItem, Question)
+def export_path(test_id: str, with_answers: bool, version: str) -> Path:
+    variant = "answers" if with_answers else "questions"
+    return EXPORT_CACHE_DIR / test_id[:2] / f"{test_id}.{variant}.{version}.pdf"
+
+async def load_questions_many(s: AsyncSession, test_ids: list[str]) -> dict[str, list[Question]]:
+    """load_questions for many tests, one query per 1000 ids."""
+    out: dict[str, list[Question]] = {t: [] for t in test_ids}
+    for batch in chunked(test_ids):
+        rows = await s.execute(
+            select(TestItem.test_id, Question)
             .join(Question, Question.id == TestItem.question_id)
-            .where(TestItem.test_id == test_id)
-        )).all()
+            .where(TestItem.test_id.in_(batch))
+            .order_by(TestItem.test_id, TestItem.id)
+        )
+        for test_id, q in rows:
+            out[test_id].append(q)
+    return out
+
+async def cached_test_pdf(s: AsyncSession, test_id: str, with_answers: bool = False) -> CachedPdf:
+    """
+    Path and ETag of the test's PDF, rendering it only if this content version isn't on disk.
+    Ends the session's transaction once the questions are loaded.
+    """
+    questions = await load_questions(s, test_id)
+    await s.commit()  # don't hold a pooled connection during the render
+    return await ensure_test_pdf(test_id, questions, with_answers)
+
+async def ensure_test_pdf(test_id: str, questions: list[Question], with_answers: bool,
+                          wait: bool = False) -> CachedPdf:
+    """The test's PDF for these questions; `wait` queues for a render slot instead of raising RenderPoolBusy."""
+    version = content_version(test_id, questions, with_answers)
+    path = export_path(test_id, with_answers, version)
+    if path.exists():
+        metrics.PDF_EXPORTS.inc("hit")
+    else:
+        metrics.PDF_EXPORTS.inc("miss")
+        # plain tuples: the render runs in another process
+        items = [(q.question_text, q.options, q.correct_answer) for q in questions]
+        start = time.perf_counter()
+        await render_pool.pool.render(path, _render_to, path, test_id, items, with_answers, wait=wait)
+        metrics.PDF_RENDER.observe(time.perf_counter() - start, "test")
+        stem = path.name.rsplit(".", 2)[0]  # <test_id>.<variant>
+        for stale in path.parent.glob(f"{stem}.*.pdf"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    return CachedPdf(path, f'"{version}"', path.stat().st_size)
+
+def _render_to(path: Path, test_id: str, items: list[PdfItem], with_answers: bool) -> None:
+    # runs in a render pool process; the PDF only becomes visible once complete
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        render_test_pdf(tmp, test_id, items, with_answers)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def render_test_pdf(out: Path | BinaryIO, test_id: str, items: list[PdfItem], with_answers: bool = False) -> None:
+    """Draws the test into `out`, a file path or a binary file object."""
+    c = canvas.Canvas(str(out) if isinstance(out, Path) else out, pagesize=A4)
+    width, height = A4
 
     y = height - 2*cm
     c.setFont("Helvetica-Bold", 16)
@@ -26,23 +123,23 @@ async def build_test_pdf(test_id: str, with_answers: bool = False) -> bytes:
     c.setFont("Helvetica", 11)
 
     qnum = 1
-    for _, q in rows:
-        text = f"{qnum}. {q.question_text}"
+    for question_text, options, correct_answer in items:
+        text = f"{qnum}. {question_text}"
         c.drawString(2*cm, y, text[:1000])
         y -= 0.8*cm
 
-        if q.options:
+        if options:
             # print options in A/B/C/D order when available
-            for key in sorted(q.options.keys()):
-                c.drawString(2.5*cm, y, f"{key}) {q.options[key]}")
+            for key in sorted(options.keys()):
+                c.drawString(2.5*cm, y, f"{key}) {options[key]}")
                 y -= 0.7*cm
 
         # answer line
         c.line(2*cm, y, width-2*cm, y)
         y -= 0.8*cm
-        if with_answers and getattr(q, 'correct_answer', None):
+        if with_answers and correct_answer:
             c.setFont("Helvetica-Oblique", 10)
-            c.drawString(2*cm, y, f"Answer: {q.correct_answer}")
+            c.drawString(2*cm, y, f"Answer: {correct_answer}")
             c.setFont("Helvetica", 11)
             y -= 0.6*cm
 
@@ -55,5 +152,84 @@ async def build_test_pdf(test_id: str, with_answers: bool = False) -> bytes:
 
     c.showPage()
     c.save()
-    buf.seek(0)
-    return buf.read()
+
+# --- class sets: many tests in one download ------------------------------------
+async def ensure_many(questions: dict[str, list[Question]], with_answers: bool
+                      ) -> AsyncIterator[tuple[str, CachedPdf]]:
+    """
+    ensure_test_pdf for many tests, yielded in completion order. Renders wait for a slot
+    rather than fail: a streamed ZIP has already sent its 200 when they start.
+    """
+    # a couple per pool process keeps every core busy without queueing the whole set
+    limit = asyncio.Semaphore(2 * render_pool.pool.workers)
+    async def one(test_id: str) -> tuple[str, CachedPdf]:
+        async with limit:
+            return test_id, await ensure_test_pdf(test_id, questions[test_id], with_answers, wait=True)
+    tasks = [asyncio.create_task(one(t)) for t in questions]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            t.cancel()
+
+class _Spool:
+    """Write-only sink for zipfile; it can't seek, so entries get data descriptors."""
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data: bytes) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def take(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+async def stream_zip(entries: AsyncIterator[tuple[str, Path]], chunk_size: int) -> AsyncIterator[bytes]:
+    """ZIP of (name, file) entries, yielded while later entries are still being produced."""
+    sink = _Spool()
+    # stored, not deflated: the PDFs are compressed already; file reads go to a thread
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        async for name, path in entries:
+            src = await asyncio.to_thread(open, path, "rb")
+            try:
+                with zf.open(name, "w") as dst:
+                    while block := await asyncio.to_thread(src.read, chunk_size):
+                        dst.write(block)
+                        if sink.pending >= chunk_size:
+                            yield sink.take()
+            finally:
+                src.close()
+            yield sink.take()
+    yield sink.take()
+
+def merge_pdfs(out: Path, parts: list[tuple[str, Path]]) -> None:
+    """Concatenates PDFs into `out` with one bookmark per part; runs in a render pool process."""
+    import fitz
+    tmp = out.with_name(f".{out.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with fitz.open() as doc:
+            toc = []
+            for title, path in parts:
+                toc.append([1, title, doc.page_count + 1])
+                with fitz.open(path) as src:
+                    doc.insert_pdf(src)
+            doc.set_toc(toc)
+            doc.save(tmp, garbage=1, deflate=True)
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
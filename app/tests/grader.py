@@ -0,0 +1,191 @@
+"""
+Batch grading against precompiled answer keys.
+
+Each Question is compiled once into an AnswerKey (normalized correct text plus an
+option key -> normalized text map for MCQs) and cached by question id. A batch is
+graded into one boolean array, with each distinct (question, answer) pair graded
+once, and per-test scores come from a single bincount over it, so regrading all
+tests of a class costs about a dict lookup per answer.
+
+    python -m app.tests.grader regrade [--file FILE_ID]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+import numpy as np
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import SessionLocal
+from app.db.models import Question, QType, Answer, Test, TestItem, Concept
+from app.db.upsert import chunked
+from app.analytics import rollups
+from app.tests.grading import match_short, SHORT_ANSWER_MATCH
+
+GRADING_KEY_CACHE_SIZE = int(os.getenv("GRADING_KEY_CACHE_SIZE", "50000"))
+# upper bound on staleness for questions edited by other processes
+GRADING_KEY_TTL = int(os.getenv("GRADING_KEY_TTL", "300"))
+
+def normalize(s: str | None) -> str:
+    # trim, collapse whitespace, lowercase
+    return " ".join((s or "").split()).lower()
+
+@dataclass(frozen=True, slots=True)
+class AnswerKey:
+    question_id: str
+    qtype: QType
+    correct: str              # normalized
+    options: dict[str, str]   # option key -> normalized option text (MCQ only)
+    match: str | None = None  # short-answer MatchMode set on the question
+
+    @classmethod
+    def compile(cls, qid: str, qtype: QType, correct_answer: str | None, options,
+                match: str | None = None) -> "AnswerKey":
+        opts = {}
+        if qtype == QType.mcq and isinstance(options, dict):
+            opts = {str(k): normalize(str(v)) for k, v in options.items()}
+        return cls(qid, qtype, normalize(correct_answer), opts, match)
+
+    def grade(self, answer: str, match: str | None = None) -> bool:
+        """`match` is the test's MatchMode; the question's own setting wins over it."""
+        raw = answer.strip()
+        if self.qtype == QType.short:
+            return match_short(normalize(raw), self.correct, self.match or match or SHORT_ANSWER_MATCH)
+        # an MCQ answer may be the option key ("B") or the option text
+        return self.options.get(raw, normalize(raw)) == self.correct
+
+class KeyCache:
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, AnswerKey]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, qid: str) -> AnswerKey | None:
+        entry = self._entries.get(qid)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(qid, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(qid)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: AnswerKey) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key.question_id] = (time.monotonic() + self.ttl, key)
+        self._entries.move_to_end(key.question_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, qid: str) -> None:
+        self._entries.pop(qid, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+cache = KeyCache(GRADING_KEY_CACHE_SIZE, GRADING_KEY_TTL)
+
+@event.listens_for(Question, "after_update")
+@event.listens_for(Question, "after_delete")
+def _question_changed(mapper, connection, target: Question) -> None:
+    cache.invalidate(target.id)
+
+async def load_keys(s: AsyncSession, qids: Iterable[str]) -> dict[str, AnswerKey]:
+    keys, missing = {}, []
+    for qid in set(qids):
+        key = cache.get(qid)
+        if key is None:
+            missing.append(qid)
+        else:
+            keys[qid] = key
+    for batch in chunked(missing):
+        rows = await s.execute(
+            select(Question.id, Question.question_type, Question.correct_answer, Question.options,
+                   Question.answer_match)
+            .where(Question.id.in_(batch))
+        )
+        for r in rows:
+            key = AnswerKey.compile(r.id, r.question_type, r.correct_answer, r.options, r.answer_match)
+            cache.put(key)
+            keys[r.id] = key
+    return keys
+
+def grade_batch(keys: dict[str, AnswerKey], qids: Sequence[str], answers: Sequence[str],
+                match: str | None = None) -> np.ndarray:
+    """
+    Grades answers[i] against keys[qids[i]] under the test-level MatchMode `match`;
+    answers to unknown questions are wrong.
+    A class answers each question with few distinct strings, so every distinct
+    (question, answer) pair is graded once and the rest are dict hits.
+    """
+    verdicts: dict[tuple[str, str], bool] = {}
+    def verdict(pair: tuple[str, str]) -> bool:
+        key = keys.get(pair[0])
+        verdicts[pair] = ok = key is not None and key.grade(pair[1], match)
+        return ok
+    return np.fromiter((verdicts[p] if p in verdicts else verdict(p) for p in zip(qids, answers)),
+                       dtype=bool, count=len(qids))
+
+async def regrade(s: AsyncSession, test_ids: Sequence[str]) -> int:
+    """Re-grades stored answers of the given tests and refreshes their scores; returns changed answers."""
+    rows = (await s.execute(
+        select(Answer.id, Answer.test_id, Answer.question_id, Answer.user_answer, Answer.is_correct)
+        .where(Answer.test_id.in_(test_ids))
+    )).all()
+    tests = {t.id: t for t in (await s.execute(
+        select(Test.id, Test.total_questions, Test.answer_match).where(Test.id.in_(test_ids))
+    )).all()}
+    keys = await load_keys(s, (r.question_id for r in rows))
+    # one pass per test-level match mode; there are only a handful
+    by_match: dict[str | None, list[int]] = {}
+    for i, r in enumerate(rows):
+        by_match.setdefault(tests[r.test_id].answer_match, []).append(i)
+    ok = np.zeros(len(rows), dtype=bool)
+    for match, idx in by_match.items():
+        ok[idx] = grade_batch(keys, [rows[i].question_id for i in idx], [rows[i].user_answer or "" for i in idx], match)
+    changed = [{"id": r.id, "is_correct": bool(v)} for r, v in zip(rows, ok) if bool(v) != r.is_correct]
+    for batch in chunked(changed):
+        await s.execute(update(Answer), batch)
+
+    test_idx = {t: i for i, t in enumerate(test_ids)}
+    sub = np.fromiter((test_idx[r.test_id] for r in rows), dtype=np.int64, count=len(rows))
+    correct = np.bincount(sub, weights=ok, minlength=len(test_ids)).astype(np.int64)
+    params = [{"id": t, "correct_count": int(correct[i]),
+               "score": float(correct[i] / tests[t].total_questions * 100.0) if tests[t].total_questions else 0.0}
+              for t, i in test_idx.items() if t in tests]
+    if params:
+        await s.execute(update(Test), params)
+    return len(changed)
+
+async def regrade_all(file_id: str | None = None, batch_tests: int = 500) -> int:
+    changed = 0
+    async with SessionLocal() as s:
+        q = select(Test.id).order_by(Test.id)
+        if file_id:
+            q = q.where(Test.id.in_(
+                select(TestItem.test_id)
+                .join(Question, Question.id == TestItem.question_id)
+                .join(Concept, Concept.id == Question.concept_id)
+                .where(Concept.file_id == file_id)
+            ))
+        test_ids = (await s.execute(q)).scalars().all()
+        for batch in chunked(test_ids, batch_tests):
+            changed += await regrade(s, batch)
+            await s.commit()
+    if changed:
+        await rollups.backfill()  # correct rates and scores moved
+    return changed
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog="python -m app.tests.grader")
+    ap.add_argument("command", choices=["regrade"])
+    ap.add_argument("--file", dest="file_id", help="only tests drawn from this file")
+    args = ap.parse_args()
+    print(f"changed {asyncio.run(regrade_all(args.file_id))} answers")
@@ -1,7 +1,17 @@
 from __future__ import annotations
+import os
 import re
-from difflib import SequenceMatcher
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Literal
+
+MatchMode = Literal["exact", "token_set", "levenshtein"]
+
+# default for short answers; questions and tests can choose their own
+SHORT_ANSWER_MATCH: MatchMode = os.getenv("SHORT_ANSWER_MATCH", "exact")
+SHORT_ANSWER_THRESHOLD = float(os.getenv("SHORT_ANSWER_THRESHOLD", "0.85"))
+SHORT_ANSWER_MAX_CHARS = int(os.getenv("SHORT_ANSWER_MAX_CHARS", "256"))
+
+_PUNCT = ".,;:!?\"'()[]{}"
+_WORD = re.compile(r"\w+")
 
 def _collapse_ws(s: str) -> str:
     # strip, collapse multiple spaces/tabs/newlines to single space
@@ -14,27 +24,90 @@ def normalize_text(s: str) -> str:
     """
     s = _collapse_ws(s.lower())
     # strip common leading/trailing punctuation
-    return s.strip(".,;:!?\"'()[]{}")
+    return s.strip(_PUNCT)
 
-def similar(a: str, b: str) -> float:
+def token_set_ratio(a: str, b: str) -> float:
     """
-    Cheap similarity using difflib (no extra deps).
-    Returns 0..1.
+    Jaccard overlap of the word sets, so word order, repeats and
+    punctuation don't matter. Returns 0..1.
     """
-    return SequenceMatcher(None, a, b).ratio()
+    ta, tb = set(_WORD.findall(a)), set(_WORD.findall(b))
+    if not ta and not tb:
+        return 1.0
+    return len(ta & tb) / len(ta | tb)
 
-def grade_short_answer(user_answer: str, correct_answer: str, *, threshold: float = 0.85) -> bool:
+def levenshtein_within(a: str, b: str, k: int) -> Optional[int]:
     """
-    Returns True if answers are equal after normalization, or
-    similar enough based on `threshold`.
+    Edit distance between a and b if it is at most k, else None.
+    Bit-parallel (Myers/Hyyrö): one column of the DP table per character of b as
+    a few int operations, and the scan stops as soon as the remaining characters
+    can no longer bring the distance back under k.
     """
-    ua = normalize_text(user_answer)
-    ca = normalize_text(correct_answer)
-    if not ua and not ca:
-        return True
-    if ua == ca:
+    # common prefix/suffix never change the distance
+    p = 0
+    while p < len(a) and p < len(b) and a[p] == b[p]:
+        p += 1
+    a, b = a[p:], b[p:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if len(a) > len(b):
+        a, b = b, a
+    m, n = len(a), len(b)
+    if n - m > k:
+        return None
+    if m == 0:
+        return n
+    peq: Dict[str, int] = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    full, top = (1 << m) - 1, 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for j, ch in enumerate(b):
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & top:
+            score += 1
+        elif mh & top:
+            score -= 1
+        if score - (n - j - 1) > k:
+            return None
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score if score <= k else None
+
+def similar(a: str, b: str, threshold: float) -> bool:
+    """
+    True if 1 - levenshtein(a, b) / max(len) >= threshold.
+    Inputs are cut to SHORT_ANSWER_MAX_CHARS so the cost stays bounded.
+    """
+    a, b = a[:SHORT_ANSWER_MAX_CHARS], b[:SHORT_ANSWER_MAX_CHARS]
+    k = int((1.0 - threshold) * max(len(a), len(b)) + 1e-9)
+    return levenshtein_within(a, b, k) is not None
+
+def match_short(user_answer: str, correct_answer: str, mode: str = SHORT_ANSWER_MATCH,
+                threshold: float = SHORT_ANSWER_THRESHOLD) -> bool:
+    """
+    Compares two already normalized answers with the given MatchMode.
+    """
+    if user_answer == correct_answer:
         return True
-    return similar(ua, ca) >= threshold
+    if mode == "token_set":
+        return token_set_ratio(user_answer, correct_answer) >= threshold
+    if mode == "levenshtein":
+        return similar(user_answer.strip(_PUNCT), correct_answer.strip(_PUNCT), threshold)
+    return False
+
+def grade_short_answer(user_answer: str, correct_answer: str, *, mode: str = SHORT_ANSWER_MATCH,
+                       threshold: float = SHORT_ANSWER_THRESHOLD) -> bool:
+    """
+    Returns True if answers are equal after normalization, or match under `mode`.
+    """
+    return match_short(normalize_text(user_answer), normalize_text(correct_answer), mode, threshold)
 
 def grade_mcq(user_answer: str, correct_answer: str, options: Optional[Dict[str, Any]] = None) -> bool:
     """
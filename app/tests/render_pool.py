@@ -0,0 +1,95 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable
+
+# ReportLab is pure Python and holds the GIL, so renders go to separate processes
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+# renders allowed in flight + queued before new ones are rejected
+PDF_RENDER_MAX_PENDING = int(os.getenv("PDF_RENDER_MAX_PENDING", "32"))
+PDF_RENDER_RETRY_AFTER = int(os.getenv("PDF_RENDER_RETRY_AFTER", "5"))
+
+class RenderPoolBusy(Exception):
+    def __init__(self, retry_after: int = PDF_RENDER_RETRY_AFTER):
+        super().__init__("PDF render pool is saturated")
+        self.retry_after = retry_after
+
+class RenderPool:
+    """
+    Process pool for renders that write to a file. Concurrent requests for the same
+    output share one render instead of queueing duplicates. A full pool rejects new
+    renders, or makes them wait for a slot when the caller can't take a retry.
+    """
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._inflight: dict[Path, asyncio.Future] = {}  # only touched from the event loop thread
+        self._waiters: list[asyncio.Future] = []          # wait=True renders queued for a slot
+        self.completed = 0
+        self.shared = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    async def render(self, out: Path, fn: Callable[..., Any], *args: Any, wait: bool = False) -> None:
+        """
+        Runs fn(*args) in the pool; fn writes `out`. Joins a render of `out` already running.
+        When the pool is full, raises RenderPoolBusy, or with `wait` waits for a free slot.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            running = self._inflight.get(out)
+            if running is not None:
+                self.shared += 1
+                return await asyncio.shield(running)
+            if len(self._inflight) < self.max_pending:
+                break
+            if not wait:
+                self.rejected += 1
+                raise RenderPoolBusy()
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        fut = loop.run_in_executor(self._get_executor(), fn, *args)
+        self._inflight[out] = fut
+        try:
+            await asyncio.shield(fut)
+        finally:
+            if self._inflight.get(out) is fut:
+                del self._inflight[out]
+            self.completed += 1
+            # every waiter re-checks, so a cancelled one can't swallow the free slot
+            for waiter in self._waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._waiters.clear()
+
+    def stats(self) -> dict:
+        pending = len(self._inflight)
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(pending, self.workers),
+            "queued": max(pending - self.workers, 0),
+            "completed": self.completed,
+            "waiting": len(self._waiters),
+            "shared": self.shared,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+pool = RenderPool(PDF_RENDER_WORKERS, PDF_RENDER_MAX_PENDING)
@@ -1,29 +1,20 @@
 
-# --- grading helpers ---------------------------------------------------------
-def _normalize_text(s: str) -> str:
-    # trim, collapse whitespace, lowercase
-    return " ".join((s or "").split()).strip().lower()
-
-def grade_short_answer(answer: str, correct: str) -> bool:
-    return _normalize_text(answer) == _normalize_text(correct)
-
-def grade_mcq(answer: str, correct: str, options: dict | None) -> bool:
-    # if user sent an option key like "B", map it to the option text
-    if isinstance(options, dict) and answer in options:
-        answer_text = str(options[answer])
-    else:
-        answer_text = str(answer)
-    return _normalize_text(answer_text) == _normalize_text(correct)
-# ----------------------------------------------------------------------------- 
-
-from fastapi import APIRouter, HTTPException, Depends
+import os
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from datetime import datetime
-from sqlalchemy import select, func
-from app.db.session import SessionLocal
-from app.db.models import User, Test, TestItem, Answer, Question, Concept
-from app.deps import get_current_user
+from sqlalchemy import select, insert, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_session
+from app.db.models import Test, TestItem, Answer, Question, uid
+from app.db.upsert import insert_for, chunked
+from app.db.pagination import encode_cursor, decode_cursor, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from app.deps import get_current_user, CurrentUser
+from app.tests.sampling import Stratify, draw_questions
+from app.tests import grader
+from app.analytics import rollups
+from app.tests.grading import MatchMode
 
 router = APIRouter(prefix="/tests", tags=["tests"])
 
@@ -31,127 +22,243 @@ class CreateTestIn(BaseModel):
     file_id: str
     num_questions: int = 5
     difficulty: int | None = None
+    stratify: Stratify | None = None  # spread the draw proportionally over difficulties or concepts
+    answer_match: MatchMode | None = None  # short-answer matching where a question sets none
+    adaptive: bool = False  # weight by measured correct rates and your weak concepts
+    distinct: bool = False  # at most one question per near-duplicate group
 
 @router.post("/create")
-async def create_test(body: CreateTestIn, user: User = Depends(get_current_user)):
-    async with SessionLocal() as s:
-        q = (select(Question)
-             .join(Concept, Question.concept_id == Concept.id)
-             .where(Concept.file_id == body.file_id))
-        if body.difficulty:
-            q = q.where(Question.difficulty == body.difficulty)
-        q = q.order_by(func.random()).limit(body.num_questions)
-        rows = (await s.execute(q)).scalars().all()
-        if not rows:
-            raise HTTPException(404, "No questions found for this file")
-
-        test = Test(user_id=user.id, test_date=datetime.utcnow(),
-                    total_questions=len(rows), correct_count=0, score=0.0)
-        s.add(test); await s.flush()
-
-        items = []
-        for ques in rows:
-            s.add(TestItem(test_id=test.id, question_id=ques.id))
-            items.append({
-                "question_id": ques.id,
-                "type": ques.question_type.value,
-                "question_text": ques.question_text,
-                "options": ques.options,
-                "difficulty": ques.difficulty
-            })
-        await s.commit()
-        return {"test_id": test.id, "total_questions": test.total_questions, "items": items}
+async def create_test(body: CreateTestIn, user: CurrentUser = Depends(get_current_user),
+                      s: AsyncSession = Depends(get_session)):
+    if body.adaptive and body.stratify:
+        raise HTTPException(422, "adaptive and stratify can't be combined")
+    rows = await draw_questions(s, body.file_id, body.num_questions, difficulty=body.difficulty,
+                                stratify=body.stratify, adaptive_for=user.id if body.adaptive else None,
+                                distinct=body.distinct)
+    if not rows:
+        raise HTTPException(404, "No questions found for this file")
+
+    test = Test(user_id=user.id, test_date=datetime.utcnow(),
+                total_questions=len(rows), correct_count=0, score=0.0, answer_match=body.answer_match)
+    s.add(test); await s.flush()
+
+    # one multi-row INSERT instead of a flush per item
+    for batch in chunked(rows):
+        await s.execute(insert(TestItem).values([{"id": uid(), "test_id": test.id, "question_id": q.id} for q in batch]))
+    items = [{
+        "question_id": ques.id,
+        "type": ques.question_type.value,
+        "question_text": ques.question_text,
+        "options": ques.options,
+        "difficulty": ques.difficulty
+    } for ques in rows]
+    await s.commit()
+    return {"test_id": test.id, "total_questions": test.total_questions, "items": items}
 
 # IMPORTANT: define /mine BEFORE /{test_id}
 @router.get("/mine")
-async def list_my_tests(user: User = Depends(get_current_user)):
-    async with SessionLocal() as s:
-        tests = (await s.execute(
-            select(Test).where(Test.user_id == user.id).order_by(Test.created_at.desc())
-        )).scalars().all()
-        return [{"id": t.id, "date": t.test_date.isoformat(),
-                 "total": t.total_questions, "correct": t.correct_count, "score": t.score}
-                for t in tests]
+async def list_my_tests(response: Response, cursor: str | None = None,
+                        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                        user: CurrentUser = Depends(get_current_user), s: AsyncSession = Depends(get_session)):
+    """Newest first; when there are more, X-Next-Cursor holds the `cursor` for the next page."""
+    q = (select(Test.id, Test.test_date, Test.total_questions, Test.correct_count, Test.score, Test.created_at)
+         .where(Test.user_id == user.id))
+    if cursor:
+        created_at, test_id = decode_cursor(cursor, datetime, str)
+        q = q.where(tuple_(Test.created_at, Test.id) < tuple_(created_at, test_id))
+    rows = (await s.execute(q.order_by(Test.created_at.desc(), Test.id.desc()).limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [{"id": t.id, "date": t.test_date.isoformat(),
+             "total": t.total_questions, "correct": t.correct_count, "score": t.score}
+            for t in rows]
 
 @router.get("/{test_id}")
-async def get_test(test_id: str, user: User = Depends(get_current_user)):
-    async with SessionLocal() as s:
-        test = (await s.execute(
-            select(Test).where(Test.id == test_id, Test.user_id == user.id)
-        )).scalar_one_or_none()
-        if not test:
-            raise HTTPException(404, "Test not found")
-        rows = (await s.execute(
-            select(TestItem, Question)
-            .join(Question, Question.id == TestItem.question_id)
-            .where(TestItem.test_id == test_id)
-        )).all()
-        items = [{
-            "question_id": q.id,
-            "type": q.question_type.value,
-            "question_text": q.question_text,
-            "options": q.options,
-            "difficulty": q.difficulty
-        } for _, q in rows]
-        return {
-            "test_id": test.id,
-            "test_date": test.test_date.isoformat(),
-            "total_questions": test.total_questions,
-            "correct_count": test.correct_count,
-            "score": test.score,
-            "items": items
-        }
+async def get_test(test_id: str, user: CurrentUser = Depends(get_current_user),
+                   s: AsyncSession = Depends(get_session)):
+    test = (await s.execute(
+        select(Test).where(Test.id == test_id, Test.user_id == user.id)
+    )).scalar_one_or_none()
+    if not test:
+        raise HTTPException(404, "Test not found")
+    rows = (await s.execute(
+        select(TestItem, Question)
+        .join(Question, Question.id == TestItem.question_id)
+        .where(TestItem.test_id == test_id)
+    )).all()
+    items = [{
+        "question_id": q.id,
+        "type": q.question_type.value,
+        "question_text": q.question_text,
+        "options": q.options,
+        "difficulty": q.difficulty
+    } for _, q in rows]
+    return {
+        "test_id": test.id,
+        "test_date": test.test_date.isoformat(),
+        "total_questions": test.total_questions,
+        "correct_count": test.correct_count,
+        "score": test.score,
+        "items": items
+    }
 
 class SubmitIn(BaseModel):
     answers: List[Dict[str, Any]]
 
 @router.post("/{test_id}/submit")
-async def submit_test(test_id: str, body: SubmitIn, user: User = Depends(get_current_user)):
-    async with SessionLocal() as s:
-        test = (await s.execute(
-            select(Test).where(Test.id == test_id, Test.user_id == user.id)
-        )).scalar_one_or_none()
-        if not test:
-            raise HTTPException(404, "Test not found")
-
-        rows = (await s.execute(
-            select(TestItem, Question)
-            .join(Question, Question.id == TestItem.question_id)
-            .where(TestItem.test_id == test_id)
-        )).all()
-        qmap = {q.id: q for _, q in rows}
-
-        correct = 0
-        for a in body.answers:
-            qid = a.get("question_id"); ans = str(a.get("answer", "")).strip()
-            q = qmap.get(qid)
-            if not q:
-                continue
-            ok = grade_mcq(ans, q.correct_answer or "", q.options) if q.question_type.name == "mcq" or str(q.question_type) in ("mcq","QType.mcq") else grade_short_answer(ans, q.correct_answer or "")
-            if ok: correct += 1
-            s.add(Answer(test_id=test.id, question_id=qid, user_answer=ans, is_correct=ok))
-
-        total = test.total_questions or 0
-        test.correct_count = correct
-        test.score = float((correct / total) * 100.0) if total else 0.0
-        await s.commit()
-        return {"test_id": test.id, "correct": correct, "total": total, "score": test.score}
-
-
-from fastapi.responses import StreamingResponse
-from app.tests.export import build_test_pdf
+async def submit_test(test_id: str, body: SubmitIn, user: CurrentUser = Depends(get_current_user),
+                      s: AsyncSession = Depends(get_session)):
+    # row lock: concurrent submits of one test would both diff against the same previous answers
+    test = (await s.execute(
+        select(Test).where(Test.id == test_id, Test.user_id == user.id).with_for_update()
+    )).scalar_one_or_none()
+    if not test:
+        raise HTTPException(404, "Test not found")
+
+    qids = (await s.execute(select(TestItem.question_id).where(TestItem.test_id == test_id))).scalars().all()
+    keys = await grader.load_keys(s, qids)
+
+    submitted = {}  # question_id -> answer; a repeated question keeps its last answer
+    for a in body.answers:
+        qid = a.get("question_id")
+        if qid in keys:
+            submitted[qid] = str(a.get("answer", "")).strip()
+    ok = grader.grade_batch(keys, list(submitted), list(submitted.values()), test.answer_match)
+    graded = [{"id": uid(), "test_id": test.id, "question_id": qid, "user_answer": ans, "is_correct": bool(v)}
+              for (qid, ans), v in zip(submitted.items(), ok)]
+
+    previous = dict((await s.execute(
+        select(Answer.question_id, Answer.is_correct).where(Answer.test_id == test.id)
+    )).all())
+    # upsert so a resubmit overwrites earlier answers instead of duplicating them
+    for batch in chunked(graded):
+        stmt = insert_for(s, Answer).values(batch)
+        await s.execute(stmt.on_conflict_do_update(
+            index_elements=["test_id", "question_id"],
+            set_={"user_answer": stmt.excluded.user_answer, "is_correct": stmt.excluded.is_correct},
+        ))
+    now_correct = {g["question_id"]: g["is_correct"] for g in graded}
+    correct = sum({**previous, **now_correct}.values())
+
+    total = test.total_questions or 0
+    old_score = test.score or 0.0
+    test.correct_count = correct
+    test.score = float((correct / total) * 100.0) if total else 0.0
+    await rollups.record_submission(s, user_id=user.id, test_date=test.test_date, previous=previous,
+                                    graded=now_correct, old_score=old_score, new_score=test.score)
+    await s.commit()
+    return {"test_id": test.id, "correct": correct, "total": total, "score": test.score}
+
+
+import re
+import time
+import uuid
+from typing import Literal
+from fastapi import Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import or_
+from app import metrics
+from app.db.models import Concept, UploadedFile, User
+from app.tests import render_pool
+from app.tests.export import (cached_test_pdf, load_questions_many, ensure_many, stream_zip, merge_pdfs,
+                              EXPORT_CACHE_DIR)
+
+PDF_STREAM_CHUNK = int(os.getenv("PDF_STREAM_CHUNK", str(64 * 1024)))
+BULK_EXPORT_MAX_TESTS = int(os.getenv("BULK_EXPORT_MAX_TESTS", "1000"))
+_UNSAFE = re.compile(r"[^\w.-]+")  # for file names inside the archive
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 @router.get("/{test_id}/export.pdf")
-async def export_test_pdf(test_id: str, with_answers: bool = False, user: User = Depends(get_current_user)):
-    # reuse the auth/ownership check in get_test:
-    async with SessionLocal() as s:
-        test = (await s.execute(
-            select(Test).where(Test.id == test_id, Test.user_id == user.id)
-        )).scalar_one_or_none()
-        if not test:
-            raise HTTPException(404, "Test not found")
-
-    data = await build_test_pdf(test_id, with_answers=with_answers)
-    return StreamingResponse(iter([data]),
-                             media_type="application/pdf",
-                             headers={"Content-Disposition": f"attachment; filename=test_{test_id}.pdf"})
+async def export_test_pdf(test_id: str, request: Request, with_answers: bool = False,
+                          user: CurrentUser = Depends(get_current_user), s: AsyncSession = Depends(get_session)):
+    # reuse the auth/ownership check in get_test; the question load shares this session
+    test = (await s.execute(
+        select(Test).where(Test.id == test_id, Test.user_id == user.id)
+    )).scalar_one_or_none()
+    if not test:
+        raise HTTPException(404, "Test not found")
+
+    pdf = await cached_test_pdf(s, test_id, with_answers=with_answers)
+    headers = {"ETag": pdf.etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), pdf.etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse streams the cached file in chunks and serves Range / If-Range requests
+    resp = FileResponse(pdf.path, media_type="application/pdf", filename=f"test_{test_id}.pdf", headers=headers)
+    resp.chunk_size = PDF_STREAM_CHUNK
+    return resp
+
+class BulkExportIn(BaseModel):
+    test_ids: List[str] | None = None
+    file_id: str | None = None          # every test drawn from this file...
+    user_ids: List[str] | None = None   # ...optionally only these students'
+    with_answers: bool = False
+    format: Literal["zip", "pdf"] = "zip"
+
+def _tests_from_file(cond):
+    return (select(TestItem.test_id)
+            .join(Question, Question.id == TestItem.question_id)
+            .join(Concept, Concept.id == Question.concept_id)
+            .where(cond))
+
+@router.post("/export")
+async def export_tests_bulk(body: BulkExportIn, user: CurrentUser = Depends(get_current_user),
+                            s: AsyncSession = Depends(get_session)):
+    """
+    A class set in one download: your own tests, or tests drawn from a file you uploaded.
+    ZIP entries are streamed as their PDFs finish; "pdf" merges them in order.
+    """
+    if bool(body.test_ids) == bool(body.file_id):
+        raise HTTPException(422, "Give either test_ids or file_id")
+    if len(body.test_ids or ()) > BULK_EXPORT_MAX_TESTS:
+        raise HTTPException(413, f"At most {BULK_EXPORT_MAX_TESTS} tests per export")
+    q = select(Test.id, User.name).join(User, User.id == Test.user_id)
+    if body.file_id:
+        owner = (await s.execute(select(UploadedFile.user_id).where(UploadedFile.id == body.file_id))).scalar_one_or_none()
+        if owner != user.id:
+            raise HTTPException(404, "file not found")
+        q = q.where(Test.id.in_(_tests_from_file(Concept.file_id == body.file_id)))
+        if body.user_ids:
+            q = q.where(Test.user_id.in_(body.user_ids))
+        q = q.order_by(User.name, Test.id)
+    else:
+        owned_files = select(UploadedFile.id).where(UploadedFile.user_id == user.id)
+        q = q.where(Test.id.in_(body.test_ids),
+                    or_(Test.user_id == user.id, Test.id.in_(_tests_from_file(Concept.file_id.in_(owned_files)))))
+    names = dict((await s.execute(q.limit(BULK_EXPORT_MAX_TESTS + 1))).all())
+    if body.test_ids and len(names) != len(set(body.test_ids)):
+        raise HTTPException(404, "Test not found")
+    if not names:
+        raise HTTPException(404, "No tests found")
+    if len(names) > BULK_EXPORT_MAX_TESTS:
+        raise HTTPException(413, f"At most {BULK_EXPORT_MAX_TESTS} tests per export")
+    order = list(dict.fromkeys(body.test_ids)) if body.test_ids else list(names)
+    questions = await load_questions_many(s, order)
+    await s.commit()  # don't hold a pooled connection while the set renders and streams
+
+    def title(test_id: str) -> str:
+        return f"{_UNSAFE.sub('_', names[test_id] or '').strip('_') or 'student'}_{test_id}"
+
+    if body.format == "zip":
+        async def entries():
+            async for test_id, pdf in ensure_many(questions, body.with_answers):
+                yield f"{title(test_id)}.pdf", pdf.path
+        return StreamingResponse(stream_zip(entries(), PDF_STREAM_CHUNK), media_type="application/zip",
+                                 headers={"Content-Disposition": 'attachment; filename="tests.zip"'})
+
+    paths = {test_id: pdf.path async for test_id, pdf in ensure_many(questions, body.with_answers)}
+    out = EXPORT_CACHE_DIR / "bulk" / f"{uuid.uuid4().hex}.pdf"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    await render_pool.pool.render(out, merge_pdfs, out, [(title(t), paths[t]) for t in order])
+    metrics.PDF_RENDER.observe(time.perf_counter() - start, "merge")
+    resp = FileResponse(out, media_type="application/pdf", filename="tests.pdf",
+                        background=BackgroundTask(out.unlink, missing_ok=True))
+    resp.chunk_size = PDF_STREAM_CHUNK
+    return resp
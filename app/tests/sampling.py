@@ -0,0 +1,216 @@
+"""
+Random question draws without ORDER BY random().
+
+Each file's question ids (with concept and difficulty) are loaded once with a narrow,
+index-backed query and cached in-process; draws are then sampled in Python and only
+the chosen rows are fetched by primary key. Entries expire after QUESTION_POOL_TTL so
+questions added by other processes (the parse worker) show up, and are invalidated
+immediately for inserts made in this process.
+
+Adaptive draws weight the same pool by each question's measured correct rate (from
+the question_stats rollup, loaded with the pool) and the user's mastery of its
+concept (concept_mastery, one primary-key range read per draw): weak concepts are
+boosted, and questions whose correct rate is close to the user's mastery of the
+concept are preferred over ones far too easy or too hard.
+
+Any draw can be `distinct`: at most one question per near-duplicate group
+(question_minhash.dup_group, loaded with the pool).
+"""
+from __future__ import annotations
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Literal
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import Question, Concept, QuestionStats, ConceptMastery, QuestionMinHash
+
+QUESTION_POOL_TTL = float(os.getenv("QUESTION_POOL_TTL", "30"))
+QUESTION_POOL_CACHE_SIZE = int(os.getenv("QUESTION_POOL_CACHE_SIZE", "1024"))
+ADAPTIVE_WEAK_BOOST = float(os.getenv("ADAPTIVE_WEAK_BOOST", "2.0"))  # weight x(1 + boost) at zero mastery
+ADAPTIVE_SPREAD = float(os.getenv("ADAPTIVE_SPREAD", "0.2"))  # tolerance around the user's level
+
+Stratify = Literal["difficulty", "concept"]
+
+@dataclass(slots=True)
+class QuestionPool:
+    ids: list[str]
+    concept_ids: list[str]
+    difficulties: list[int]
+    rates: np.ndarray  # smoothed correct rate per question; 0.5 when never answered
+    dup_groups: list[str] = field(default_factory=list)  # near-duplicate group; the question's own id if unsigned
+    concepts: list[str] = field(default_factory=list)  # distinct concept ids
+    concept_codes: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))  # question -> concepts index
+    by_difficulty: dict[int, list[int]] = field(default_factory=dict)
+
+    @classmethod
+    def from_rows(cls, rows) -> "QuestionPool":
+        rates = np.fromiter((smoothed_rate(r.correct or 0, r.attempts or 0) for r in rows),
+                            dtype=np.float64, count=len(rows))
+        pool = cls([r.id for r in rows], [r.concept_id for r in rows], [r.difficulty for r in rows], rates,
+                   [r.dup_group or r.id for r in rows])
+        code = {}
+        pool.concept_codes = np.fromiter((code.setdefault(c, len(code)) for c in pool.concept_ids),
+                                         dtype=np.int64, count=len(rows))
+        pool.concepts = list(code)
+        for i, d in enumerate(pool.difficulties):
+            pool.by_difficulty.setdefault(d, []).append(i)
+        return pool
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _first_distinct(self, order, n: int, seen: set | None = None) -> list[int]:
+        seen = set() if seen is None else seen
+        out = []
+        for i in order:
+            if len(out) == n:
+                break
+            if self.dup_groups[i] not in seen:
+                seen.add(self.dup_groups[i])
+                out.append(i)
+        return out
+
+    def sample(self, n: int, *, difficulty: int | None = None, stratify: Stratify | None = None,
+               distinct: bool = False, rng: random.Random | None = None) -> list[str]:
+        rng = rng or random
+        candidates = self.by_difficulty.get(difficulty, []) if difficulty else range(len(self.ids))
+        if stratify is None and not distinct:
+            picks = rng.sample(candidates, min(n, len(candidates)))
+        elif stratify is None:
+            # a few times n random candidates nearly always hold n groups; else walk them all
+            k = min(len(candidates), 4 * n)
+            picks = self._first_distinct(rng.sample(candidates, k), n)
+            if len(picks) < n and k < len(candidates):
+                picks = self._first_distinct(rng.sample(candidates, len(candidates)), n)
+        else:
+            labels = self.difficulties if stratify == "difficulty" else self.concept_ids
+            groups: dict = {}
+            for i in candidates:
+                groups.setdefault(labels[i], []).append(i)
+            seen: set = set()
+            take = (lambda g, k: self._first_distinct(rng.sample(g, len(g)), k, seen)) if distinct else rng.sample
+            picks = _stratified(groups, n, rng, take)
+        return [self.ids[i] for i in picks]
+
+    def sample_adaptive(self, n: int, mastery: dict[str, float], *, difficulty: int | None = None,
+                        distinct: bool = False, rng: np.random.Generator | None = None) -> list[str]:
+        """Weighted draw without replacement (Efraimidis-Spirakis); `mastery` maps concept id -> 0..1."""
+        rng = rng or np.random.default_rng()
+        idx = np.asarray(self.by_difficulty.get(difficulty, []) if difficulty else range(len(self.ids)), dtype=np.int64)
+        if not len(idx):
+            return []
+        m = np.array([mastery.get(c, 0.5) for c in self.concepts], dtype=np.float64)[self.concept_codes[idx]]
+        w = (1.0 + ADAPTIVE_WEAK_BOOST * (1.0 - m)) * np.exp(-((self.rates[idx] - m) ** 2) / (2 * ADAPTIVE_SPREAD ** 2))
+        # largest u ** (1/w) wins; compared as log(u) / w so tiny weights don't underflow to ties
+        keys = np.log(rng.random(len(idx))) / np.maximum(w, 1e-12)
+        if distinct:
+            return [self.ids[i] for i in self._first_distinct(idx[np.argsort(-keys)].tolist(), n)]
+        top = np.argpartition(-keys, n)[:n] if n < len(idx) else np.arange(len(idx))
+        top = top[np.argsort(-keys[top])]
+        return [self.ids[idx[i]] for i in top]
+
+def smoothed_rate(correct: int, attempts: int) -> float:
+    # Laplace prior: unseen items sit at 0.5 and a few answers don't swing to 0 or 1
+    return (correct + 1) / (attempts + 2)
+
+def _stratified(groups: dict, n: int, rng, take=None) -> list[int]:
+    # proportional allocation, remainders to the largest fractional shares;
+    # take(group, k) picks k members (default: uniformly)
+    take = take or rng.sample
+    total = sum(len(g) for g in groups.values())
+    if n >= total:
+        picks = [i for g in groups.values() for i in take(g, len(g))]
+        rng.shuffle(picks)
+        return picks
+    shares = {k: n * len(g) / total for k, g in groups.items()}
+    quota = {k: int(v) for k, v in shares.items()}
+    for k in sorted(shares, key=lambda k: shares[k] - quota[k], reverse=True)[:n - sum(quota.values())]:
+        quota[k] += 1
+    picks = [i for k, g in groups.items() for i in take(g, quota[k])]
+    rng.shuffle(picks)
+    return picks
+
+class PoolCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, QuestionPool]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_id: str) -> QuestionPool | None:
+        entry = self._entries.get(file_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(file_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(file_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, file_id: str, pool: QuestionPool) -> None:
+        self._entries[file_id] = (time.monotonic() + self.ttl, pool)
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, file_id: str) -> None:
+        self._entries.pop(file_id, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+cache = PoolCache(QUESTION_POOL_CACHE_SIZE, QUESTION_POOL_TTL)
+
+def invalidate(file_id: str) -> None:
+    cache.invalidate(file_id)
+
+async def load_pool(s: AsyncSession, file_id: str) -> QuestionPool:
+    pool = cache.get(file_id)
+    if pool is None:
+        rows = (await s.execute(
+            select(Question.id, Question.concept_id, Question.difficulty, QuestionStats.attempts,
+                   QuestionStats.correct, QuestionMinHash.dup_group)
+            .join(Concept, Question.concept_id == Concept.id)
+            .outerjoin(QuestionStats, QuestionStats.question_id == Question.id)
+            .outerjoin(QuestionMinHash, QuestionMinHash.question_id == Question.id)
+            .where(Concept.file_id == file_id)
+        )).all()
+        pool = QuestionPool.from_rows(rows)
+        if pool:  # a file still being parsed must not stay "empty" for a whole TTL
+            cache.put(file_id, pool)
+    return pool
+
+async def load_mastery(s: AsyncSession, user_id: str, concept_ids: list[str]) -> dict[str, float]:
+    rows = await s.execute(
+        select(ConceptMastery.concept_id, ConceptMastery.attempts, ConceptMastery.correct)
+        .where(ConceptMastery.user_id == user_id, ConceptMastery.concept_id.in_(concept_ids))
+    )
+    return {r.concept_id: smoothed_rate(r.correct, r.attempts) for r in rows}
+
+async def draw_questions(s: AsyncSession, file_id: str, n: int, *, difficulty: int | None = None,
+                         stratify: Stratify | None = None, adaptive_for: str | None = None,
+                         distinct: bool = False) -> list[Question]:
+    """
+    Up to `n` distinct random questions of a file, in random order; weighted for
+    the user `adaptive_for` when given.
+    """
+    for attempt in range(2):
+        pool = await load_pool(s, file_id)
+        if adaptive_for and pool:
+            mastery = await load_mastery(s, adaptive_for, pool.concepts)
+            ids = pool.sample_adaptive(n, mastery, difficulty=difficulty, distinct=distinct)
+        else:
+            ids = pool.sample(n, difficulty=difficulty, stratify=stratify, distinct=distinct)
+        if not ids:
+            return []
+        found = {q.id: q for q in (await s.execute(select(Question).where(Question.id.in_(ids)))).scalars()}
+        if len(found) == len(ids) or attempt:
+            return [found[i] for i in ids if i in found]
+        # a cached id was deleted meanwhile: reload the pool once
+        cache.invalidate(file_id)
+    return []
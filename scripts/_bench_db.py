@@ -0,0 +1,10 @@
+"""DATABASE_URL default shared by the benchmark scripts; call it before importing app."""
+import importlib.util
+import os
+import sys
+
+def default_database_url(url: str) -> None:
+    """Uses `url` unless DATABASE_URL is set, and exits early when that needs a missing aiosqlite."""
+    os.environ.setdefault("DATABASE_URL", url)
+    if os.environ["DATABASE_URL"].startswith("sqlite+aiosqlite") and importlib.util.find_spec("aiosqlite") is None:
+        sys.exit("the default SQLite database needs aiosqlite (pip install -r requirements.txt), or set DATABASE_URL")
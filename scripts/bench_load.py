@@ -0,0 +1,421 @@
+"""
+Exam-day load test plus hot-path microbenchmarks, saved as JSON to compare commits.
+
+    python scripts/bench_load.py run --users 200 --files 20 --questions 500 --concurrency 32 --duration 30
+    DATABASE_URL=postgresql+asyncpg://... python scripts/bench_load.py run
+    python scripts/bench_load.py run --base-url http://127.0.0.1:8000   # a running server on the same DATABASE_URL
+    python scripts/bench_load.py micro
+    python scripts/bench_load.py compare bench-results/OLD.json bench-results/NEW.json
+
+`run` seeds users, parsed files and questions straight into the database, starts
+uvicorn on it (unless --base-url) and lets --concurrency clients loose. Each runs
+sessions: log in as the next seeded student (a few register instead), then a few
+rounds of creating a test, submitting it and exporting the PDF, uploading a
+lecture every --upload-every rounds. It reports throughput and p50/p95/p99 per
+route, runs the microbenchmarks (extract_text, _clean_tokens, grading,
+render_test_pdf) and writes everything to bench-results/<commit>-<time>.json.
+`compare` prints the change per metric and exits 1 when one regressed by more
+than --threshold. Without DATABASE_URL a throwaway SQLite database is used.
+"""
+import argparse
+import asyncio
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from _bench_db import default_database_url
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+_tmp = tempfile.TemporaryDirectory()
+default_database_url(f"sqlite+aiosqlite:///{_tmp.name}/bench.db")
+
+from sqlalchemy import insert  # noqa: E402
+from app.db.session import engine, SessionLocal, Base  # noqa: E402
+from app.db.models import User, UploadedFile, Concept, Question, QType, uid  # noqa: E402
+from app.auth.security import hash_password  # noqa: E402
+
+PASSWORD = "bench-password"
+WORDS = ("photosynthesis chlorophyll mitochondria respiration enzyme substrate membrane osmosis "
+         "diffusion gradient protein ribosome nucleus transcription translation glucose oxygen "
+         "carbon dioxide energy light reaction cell wall cytoplasm vacuole").split()
+
+# --- seeding -------------------------------------------------------------------
+async def seed(n_users: int, n_files: int, n_questions: int, n_concepts: int = 10) -> dict:
+    """Users share one password hash; every file gets parsed concepts and an MCQ/OX/short question mix."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    tag = uuid.uuid4().hex[:8]  # seeding twice into one database must not collide on email
+    password_hash = hash_password(PASSWORD)
+    rng = random.Random(tag)
+    users = [{"id": uid(), "email": f"bench-{tag}-{i}@example.com", "name": f"student {i}",
+              "password_hash": password_hash, "created_at": datetime.utcnow()} for i in range(n_users)]
+    files, concepts, questions, answers = [], [], [], {}
+    for f in range(n_files):
+        file_id = uid()
+        files.append({"id": file_id, "user_id": users[f % n_users]["id"], "filename": f"lecture{f}.pdf",
+                      "file_path": f"lecture{f}.pdf", "file_type": "pdf", "ai_status": "parsed",
+                      "summary": "seeded", "created_at": datetime.utcnow()})
+        ids = [uid() for _ in range(n_concepts)]
+        concepts += [{"id": c, "file_id": file_id, "keyword": WORDS[i % len(WORDS)],
+                      "description": f"Key term: {WORDS[i % len(WORDS)]}", "importance": 1 + i % 5}
+                     for i, c in enumerate(ids)]
+        for i in range(n_questions):
+            qid, kind = uid(), (QType.mcq, QType.ox, QType.short)[i % 3]
+            term = rng.choice(WORDS)
+            row = {"id": qid, "concept_id": ids[i % n_concepts], "question_type": kind, "options": None,
+                   "question_text": f"Question {f}.{i}: which term fits '{' '.join(rng.sample(WORDS, 8))}'?",
+                   "difficulty": 1 + i % 5, "created_at": datetime.utcnow()}
+            if kind == QType.mcq:
+                row.update(options=dict(zip("ABCD", rng.sample(WORDS, 4))), correct_answer="A")
+            elif kind == QType.ox:
+                row.update(correct_answer=rng.choice("OX"))
+            else:
+                row.update(correct_answer=term)
+            questions.append(row)
+            answers[qid] = row["correct_answer"]
+    async with SessionLocal() as s:
+        for model, rows in ((User, users), (UploadedFile, files), (Concept, concepts), (Question, questions)):
+            for i in range(0, len(rows), 5000):
+                await s.execute(insert(model), rows[i:i + 5000])
+        await s.commit()
+    await engine.dispose()
+    return {"tag": tag, "emails": [u["email"] for u in users], "file_ids": [f["id"] for f in files],
+            "answers": answers}
+
+# --- server --------------------------------------------------------------------
+def start_server(workers: int, workdir: Path) -> tuple[subprocess.Popen, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PARSE_WORKER_EMBEDDED": "1"}
+    # run in a scratch directory: uploads/ and exports/ are relative to the working directory
+    log = open(workdir / "server.log", "wb")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+                            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"server did not come up; see {workdir / 'server.log'}:\n"
+             + (workdir / "server.log").read_text(errors="replace")[-2000:])
+
+# --- load clients --------------------------------------------------------------
+class Client:
+    """One keep-alive connection; records (route, status, seconds, finished_at) per request."""
+    def __init__(self, base: str, samples: list):
+        url = urlsplit(base)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        self.samples = samples
+        self.token = None
+
+    def call(self, route: str, method: str, path: str, body: bytes | None = None,
+             content_type: str = "application/json") -> tuple[int, bytes]:
+        headers = {"Content-Type": content_type} if body is not None else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            status, data = resp.status, resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            status, data = 0, b""
+        self.samples.append((route, status, time.perf_counter() - start, time.monotonic()))
+        return status, data
+
+    def json(self, route: str, method: str, path: str, payload=None):
+        status, data = self.call(route, method, path, None if payload is None else json.dumps(payload).encode())
+        return status, (json.loads(data) if data and status < 500 else None)
+
+def _multipart(filename: str, content: bytes) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: text/plain\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+def student(n: int, base: str, seeded: dict, args, deadline: float, samples: list) -> None:
+    """Client n: sessions of log in (register, the first time for the first --register clients), then rounds."""
+    rng = random.Random(n)
+    c = Client(base, samples)
+    rounds = sessions = 0
+    while time.monotonic() < deadline:
+        c.token = None
+        if sessions == 0 and n < args.register:
+            status, out = c.json("POST /auth/register", "POST", "/auth/register",
+                                 {"email": f"bench-{seeded['tag']}-new{n}@example.com", "name": f"new {n}",
+                                  "password": PASSWORD})
+        else:
+            email = seeded["emails"][(n + sessions * args.concurrency) % len(seeded["emails"])]
+            status, out = c.json("POST /auth/login", "POST", "/auth/login", {"email": email, "password": PASSWORD})
+        sessions += 1
+        if status != 200:
+            continue
+        c.token = out["access_token"]
+        for _ in range(args.rounds_per_session):
+            if time.monotonic() >= deadline:
+                return
+            status, test = c.json("POST /tests/create", "POST", "/tests/create",
+                                  {"file_id": rng.choice(seeded["file_ids"]), "num_questions": args.num_questions})
+            if status == 200:
+                answers = [{"question_id": i["question_id"],
+                            "answer": seeded["answers"][i["question_id"]] if rng.random() < 0.7 else "wrong"}
+                           for i in test["items"]]
+                c.json("POST /tests/{test_id}/submit", "POST", f"/tests/{test['test_id']}/submit",
+                       {"answers": answers})
+                c.call("GET /tests/{test_id}/export.pdf", "GET",
+                       f"/tests/{test['test_id']}/export.pdf?with_answers={rng.choice('01')}")
+            rounds += 1
+            if args.upload_every and rounds % args.upload_every == 0:
+                text = "\n".join(" ".join(rng.choices(WORDS, k=12)) for _ in range(200)).encode()
+                body, ctype = _multipart(f"lecture-{n}-{rounds}.txt", text)
+                c.call("POST /files/upload", "POST", "/files/upload", body, ctype)
+
+def pct(values, q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+def summarize(samples: list, started: float, ended: float) -> dict:
+    seconds = max(ended - started, 1e-9)
+    by_route: dict[str, list] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    for route, status, elapsed, finished in samples:
+        if started <= finished <= ended:
+            by_route[route].append(elapsed)
+            errors[route] += not 200 <= status < 400
+    routes = {route: {"count": len(v), "errors": errors[route], "rps": round(len(v) / seconds, 2),
+                      "p50_ms": pct(v, 50), "p95_ms": pct(v, 95), "p99_ms": pct(v, 99), "max_ms": pct(v, 100)}
+              for route, v in sorted(by_route.items())}
+    total = sum(r["count"] for r in routes.values())
+    return {"seconds": round(seconds, 2), "requests": total, "rps": round(total / seconds, 2),
+            "errors": sum(r["errors"] for r in routes.values()), "routes": routes}
+
+def run_load(args, seeded: dict, base: str) -> dict:
+    samples: list = []  # list.append is atomic; threads share it
+    now = time.monotonic()
+    started, deadline = now + args.warmup, now + args.warmup + args.duration
+    threads = [threading.Thread(target=student, args=(n, base, seeded, args, deadline, samples), daemon=True)
+               for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, started, deadline)
+
+# --- microbenchmarks -----------------------------------------------------------
+def timeit(fn, min_time: float) -> dict:
+    number, elapsed = 1, 0.0
+    while True:  # calibrate so one sample takes at least ~2 ms
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.002:
+            break
+        number *= 10
+    per_op = [elapsed / number]
+    spent = elapsed
+    while spent < min_time or len(per_op) < 5:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        per_op.append(elapsed / number)
+        spent += elapsed
+    us = np.array(per_op) * 1e6
+    return {"p50_us": round(float(np.median(us)), 3), "p95_us": round(float(np.percentile(us, 95)), 3),
+            "mean_us": round(float(us.mean()), 3), "ops_per_s": round(1e6 / float(np.median(us)), 1),
+            "samples": len(per_op)}
+
+def run_micro(args) -> dict:
+    import fitz
+    from app.files.parser import extract_text, _clean_tokens, analyze_pages
+    from app.tests.grading import grade_mcq, grade_short_answer
+    from app.tests.grader import AnswerKey, grade_batch
+    from app.tests.export import render_test_pdf
+
+    rng = random.Random(0)
+    workdir = Path(_tmp.name)
+    pdf = workdir / "micro.pdf"
+    doc = fitz.open()
+    for p in range(args.pdf_pages):
+        page = doc.new_page()
+        page.insert_text((40, 50), "\n".join(" ".join(rng.choices(WORDS, k=10)) for _ in range(45)), fontsize=9)
+    doc.save(pdf)
+    doc.close()
+    txt = workdir / "micro.txt"
+    txt.write_text("\n".join(" ".join(rng.choices(WORDS, k=12)) for _ in range(2000)))
+    text = txt.read_text()
+    pages = text.split("\n\n") if "\n\n" in text else [text[i:i + 4000] for i in range(0, len(text), 4000)]
+
+    keys = {}
+    for i in range(40):
+        kind = (QType.mcq, QType.ox, QType.short)[i % 3]
+        keys[f"q{i}"] = AnswerKey.compile(f"q{i}", kind, "A" if kind == QType.mcq else "photosynthesis",
+                                          dict(zip("ABCD", WORDS[:4])) if kind == QType.mcq else None)
+    qids = [f"q{i % 40}" for i in range(40 * 30)]  # a class of 30 answering a 40-question test
+    answers = [rng.choice(["A", "B", "photosynthesis", "photosynthesys", "O"]) for _ in qids]
+    items = [(f"Question {i}: which term fits '{' '.join(rng.sample(WORDS, 8))}'?",
+              dict(zip("ABCD", rng.sample(WORDS, 4))) if i % 3 == 0 else None, "A") for i in range(100)]
+
+    cases = {
+        f"extract_text[pdf,{args.pdf_pages}p]": lambda: extract_text(pdf),
+        "extract_text[txt,2000 lines]": lambda: extract_text(txt),
+        f"_clean_tokens[{len(text) // 1000}KB]": lambda: list(_clean_tokens(text)),
+        "analyze_pages[txt]": lambda: analyze_pages(pages),
+        "grade_mcq": lambda: grade_mcq("B", "B", {"A": "x", "B": "y"}),
+        "grade_short_answer[typo]": lambda: grade_short_answer("photosynthesys", "photosynthesis"),
+        "grade_batch[30x40]": lambda: grade_batch(keys, qids, answers),
+        "render_test_pdf[20 items]": lambda: render_test_pdf(io.BytesIO(), "bench", items[:20], True),
+        "render_test_pdf[100 items]": lambda: render_test_pdf(io.BytesIO(), "bench", items, True),
+    }
+    out = {}
+    for name, fn in cases.items():
+        out[name] = timeit(fn, args.min_time)
+        print(f"  {name:32s} p50 {out[name]['p50_us']:12.1f} us  p95 {out[name]['p95_us']:12.1f} us")
+    return out
+
+# --- results -------------------------------------------------------------------
+def git(*cmd: str) -> str:
+    try:
+        return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def meta(args) -> dict:
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "database": engine.dialect.name, "args": {k: v for k, v in vars(args).items() if k != "func"}}
+
+def save(result: dict, out: str | None) -> Path:
+    m = result["meta"]
+    path = Path(out) if out else ROOT / "bench-results" / (
+        f"{(m['commit'] or 'nogit')[:12]}{'-dirty' if m['dirty'] else ''}-{m['timestamp'][:19].replace(':', '')}.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(result, indent=2))
+    return path
+
+def print_load(load: dict) -> None:
+    print(f"{load['requests']} requests in {load['seconds']} s: {load['rps']} req/s, {load['errors']} errors")
+    print(f"  {'route':36s} {'count':>7s} {'err':>5s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for route, r in load["routes"].items():
+        print(f"  {route:36s} {r['count']:7d} {r['errors']:5d} {r['rps']:8.1f} "
+              f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f}")
+
+def cmd_run(args) -> None:
+    result = {"meta": meta(args)}
+    print(f"seeding {args.users} users, {args.files} files x {args.questions} questions ({engine.dialect.name})")
+    seeded = asyncio.run(seed(args.users, args.files, args.questions))
+    proc = None
+    try:
+        base = args.base_url
+        if not base:
+            proc, base = start_server(args.server_workers, Path(_tmp.name))
+        print(f"driving {base} with {args.concurrency} clients for {args.duration} s (+{args.warmup} s warmup)")
+        result["load"] = run_load(args, seeded, base)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(30)
+    print_load(result["load"])
+    if not args.no_micro:
+        print("microbenchmarks")
+        result["micro"] = run_micro(args)
+    print(f"results: {save(result, args.out)}")
+
+def cmd_micro(args) -> None:
+    print("microbenchmarks")
+    result = {"meta": meta(args), "micro": run_micro(args)}
+    print(f"results: {save(result, args.out)}")
+
+def cmd_compare(args) -> None:
+    old, new = (json.loads(Path(p).read_text()) for p in (args.old, args.new))
+    print(f"old {old['meta']['commit'] and old['meta']['commit'][:12]}  new {new['meta']['commit'] and new['meta']['commit'][:12]}")
+    rows = []  # (metric, old, new, higher_is_better, enough samples to judge)
+    for route, r in new.get("load", {}).get("routes", {}).items():
+        o = old.get("load", {}).get("routes", {}).get(route)
+        if o:
+            enough = min(o["count"], r["count"]) >= args.min_count
+            rows += [(f"{route} {k}", o[k], r[k], k == "rps", enough) for k in ("rps", "p50_ms", "p95_ms", "p99_ms")]
+    if "load" in old and "load" in new:
+        rows.append(("total rps", old["load"]["rps"], new["load"]["rps"], True, True))
+    for name, m in new.get("micro", {}).items():
+        if name in old.get("micro", {}):
+            rows.append((f"{name} p50_us", old["micro"][name]["p50_us"], m["p50_us"], False, True))
+    regressed = []
+    for metric, o, n, higher_better, enough in rows:
+        change = (n - o) / o if o else 0.0
+        worse = -change if higher_better else change
+        flag = "REGRESSION" if worse > args.threshold else ("improved" if -worse > args.threshold else "")
+        if not enough:
+            flag = "(few samples)"
+        print(f"  {metric:52s} {o:12.2f} -> {n:12.2f}  {change:+7.1%}  {flag}")
+        if flag == "REGRESSION":
+            regressed.append(metric)
+    if regressed:
+        sys.exit(f"{len(regressed)} metrics regressed by more than {args.threshold:.0%}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python scripts/bench_load.py")
+    sub = ap.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="seed, drive the exam flows, then microbenchmarks")
+    run.add_argument("--users", type=int, default=200)
+    run.add_argument("--files", type=int, default=20)
+    run.add_argument("--questions", type=int, default=500, help="per file")
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--duration", type=float, default=30, help="measured seconds")
+    run.add_argument("--warmup", type=float, default=3, help="seconds run but not measured")
+    run.add_argument("--num-questions", type=int, default=20, help="per test")
+    run.add_argument("--register", type=int, default=8, help="clients whose first session registers a new account")
+    run.add_argument("--rounds-per-session", type=int, default=5, help="create/submit/export rounds per login")
+    run.add_argument("--upload-every", type=int, default=10, help="rounds between uploads per client (0 = never)")
+    run.add_argument("--server-workers", type=int, default=1)
+    run.add_argument("--base-url", help="drive this server instead of starting one")
+    run.add_argument("--no-micro", action="store_true")
+    micro = sub.add_parser("micro", help="microbenchmarks only")
+    for p in (run, micro):
+        p.add_argument("--pdf-pages", type=int, default=50)
+        p.add_argument("--min-time", type=float, default=0.5, help="seconds per microbenchmark")
+        p.add_argument("--out", help="JSON path (default bench-results/<commit>-<time>.json)")
+    cmp_ = sub.add_parser("compare", help="diff two result files")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    cmp_.add_argument("--min-count", type=int, default=30, help="requests a route needs before it is judged")
+    run.set_defaults(func=cmd_run)
+    micro.set_defaults(func=cmd_micro)
+    cmp_.set_defaults(func=cmd_compare)
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Serial vs parallel PDF text extraction on a synthetic document.
+
+    python scripts/bench_pdf_extract.py --pages 500 --workers 8 --pages-per-task 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from _bench_db import default_database_url
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+default_database_url("sqlite+aiosqlite://")  # only to import app; nothing connects
+
+import fitz  # noqa: E402
+from app.files.parser import iter_pages, iter_pdf_pages_parallel  # noqa: E402
+
+WORDS = ("photosynthesis chlorophyll mitochondria respiration enzyme substrate membrane "
+         "osmosis diffusion gradient protein ribosome nucleus transcription translation").split()
+
+def make_pdf(path: Path, pages: int, lines_per_page: int = 45) -> None:
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        text = "\n".join(" ".join(WORDS[(p + i + j) % len(WORDS)] for j in range(10))
+                         for i in range(lines_per_page))
+        page.insert_text((40, 50), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=500)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--pages-per-task", type=int, default=16)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "bench.pdf"
+        make_pdf(path, args.pages)
+        serial_chars = sum(len(p) for p in iter_pages(path))
+        serial = _time(lambda: sum(1 for _ in iter_pages(path)), args.repeat)
+
+        with ProcessPoolExecutor(args.workers, mp_context=get_context("spawn")) as ex:
+            run = lambda: list(iter_pdf_pages_parallel(path, ex, pages_per_task=args.pages_per_task,
+                                                       in_flight=args.workers))
+            assert sum(len(p) for p in run()) == serial_chars  # also warms up the pool
+            parallel = _time(run, args.repeat)
+
+    print(f"pages={args.pages} workers={args.workers} pages_per_task={args.pages_per_task}")
+    print(f"serial    {serial * 1000:9.1f} ms  ({args.pages / serial:8.0f} pages/s)")
+    print(f"parallel  {parallel * 1000:9.1f} ms  ({args.pages / parallel:8.0f} pages/s)  x{serial / parallel:.2f}")
+
+if __name__ == "__main__":
+    main()
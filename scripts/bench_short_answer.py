@@ -0,0 +1,77 @@
+"""
+Short-answer matchers on realistic answer lengths: difflib (the old fuzzy grader)
+against the banded Levenshtein and token-set modes.
+
+    python scripts/bench_short_answer.py --pairs 2000 --threshold 0.85
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from app.tests.grading import match_short, normalize_text  # noqa: E402
+
+WORDS = ("the cell membrane controls what enters and leaves the cell by diffusion osmosis and "
+         "active transport mitochondria produce energy through cellular respiration").split()
+LENGTHS = {"word": 1, "phrase": 4, "sentence": 15, "paragraph": 45}
+
+def typo(s: str, rng: random.Random, rate: float) -> str:
+    out = []
+    for ch in s:
+        r = rng.random()
+        if r < rate / 3:
+            continue
+        if r < 2 * rate / 3:
+            out.append(rng.choice("abcdefghijklmnopqrstuvwxyz"))
+            continue
+        out.append(ch)
+        if r < rate:
+            out.append(rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(out)
+
+def make_pairs(n_words: int, n: int, rng: random.Random) -> list[tuple[str, str]]:
+    pairs = []
+    for i in range(n):
+        correct = " ".join(rng.choice(WORDS) for _ in range(n_words))
+        # a mix of near misses and unrelated answers, like a real class
+        answer = typo(correct, rng, 0.08) if i % 2 else " ".join(rng.choice(WORDS) for _ in range(n_words))
+        pairs.append((normalize_text(answer), normalize_text(correct)))
+    return pairs
+
+def _time(fn, pairs) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    hits = sum(fn(a, c) for a, c in pairs)
+    return (time.perf_counter() - t0) / len(pairs), hits
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pairs", type=int, default=2000)
+    ap.add_argument("--threshold", type=float, default=0.85)
+    args = ap.parse_args()
+    t = args.threshold
+    matchers = {
+        "difflib": lambda a, c: a == c or SequenceMatcher(None, a, c).ratio() >= t,
+        "levenshtein": lambda a, c: match_short(a, c, "levenshtein", t),
+        "token_set": lambda a, c: match_short(a, c, "token_set", t),
+        "exact": lambda a, c: match_short(a, c, "exact", t),
+    }
+    rng = random.Random(0)
+    print(f"threshold={t} pairs={args.pairs} (us per answer, accepted)")
+    print(f"{'length':<18}" + "".join(f"{name:>20}" for name in matchers))
+    for label, n_words in LENGTHS.items():
+        pairs = make_pairs(n_words, args.pairs, rng)
+        avg = sum(len(c) for _, c in pairs) / len(pairs)
+        cells = []
+        for fn in matchers.values():
+            per, hits = _time(fn, pairs)
+            cells.append(f"{per * 1e6:10.1f} {hits:>8}")
+        print(f"{label + f' ({avg:.0f}ch)':<18}" + "".join(f"{c:>20}" for c in cells))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+ORDER BY random() vs the cached question pool used by /tests/create.
+
+    python scripts/bench_test_sampling.py --questions 50000 --draw 50
+    DATABASE_URL=postgresql+asyncpg://... python scripts/bench_test_sampling.py
+
+Without DATABASE_URL a throwaway SQLite database is used.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _bench_db import default_database_url
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+_tmp = tempfile.TemporaryDirectory()
+default_database_url(f"sqlite+aiosqlite:///{_tmp.name}/bench.db")
+
+from sqlalchemy import select, func, insert  # noqa: E402
+from app.db.session import engine, SessionLocal, Base  # noqa: E402
+from app.db.models import UploadedFile, Concept, Question, QType, uid  # noqa: E402
+from app.tests import sampling  # noqa: E402
+
+async def seed(n_questions: int, n_concepts: int) -> str:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as s:
+        f = UploadedFile(filename="bench.pdf", file_path="bench.pdf", file_type="pdf", ai_status="parsed")
+        s.add(f)
+        await s.flush()
+        concepts = [Concept(file_id=f.id, keyword=f"term{i}", importance=3) for i in range(n_concepts)]
+        s.add_all(concepts)
+        await s.flush()
+        rows = [{"id": uid(), "concept_id": concepts[i % n_concepts].id, "question_type": QType.mcq,
+                 "question_text": f"Question {i}?", "correct_answer": "A", "options": {"A": "x", "B": "y"},
+                 "difficulty": 1 + i % 5} for i in range(n_questions)]
+        for i in range(0, len(rows), 5000):
+            await s.execute(insert(Question), rows[i:i + 5000])
+        await s.commit()
+        return f.id
+
+async def order_by_random(file_id: str, n: int, difficulty: int | None) -> list:
+    async with SessionLocal() as s:
+        q = (select(Question).join(Concept, Question.concept_id == Concept.id).where(Concept.file_id == file_id))
+        if difficulty:
+            q = q.where(Question.difficulty == difficulty)
+        return (await s.execute(q.order_by(func.random()).limit(n))).scalars().all()
+
+async def pool_draw(file_id: str, n: int, difficulty: int | None) -> list:
+    async with SessionLocal() as s:
+        return await sampling.draw_questions(s, file_id, n, difficulty=difficulty)
+
+async def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", type=int, default=50000)
+    ap.add_argument("--concepts", type=int, default=50)
+    ap.add_argument("--draw", type=int, default=50)
+    ap.add_argument("--difficulty", type=int, default=None)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    file_id = await seed(args.questions, args.concepts)
+    n, d = args.draw, args.difficulty
+    baseline = await timed(lambda: order_by_random(file_id, n, d), args.repeat)
+    sampling.invalidate(file_id)
+    cold = await timed(lambda: (sampling.invalidate(file_id), pool_draw(file_id, n, d))[1], args.repeat)
+    warm = await timed(lambda: pool_draw(file_id, n, d), args.repeat)
+    await engine.dispose()
+
+    print(f"questions={args.questions} draw={n} difficulty={d} ({engine.dialect.name}, median of {args.repeat})")
+    print(f"order by random()   {baseline * 1000:8.2f} ms")
+    print(f"pool, cold cache    {cold * 1000:8.2f} ms  x{baseline / cold:.1f}")
+    print(f"pool, warm cache    {warm * 1000:8.2f} ms  x{baseline / warm:.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Incremental rollups (submit_test -> record_submission) must agree with backfill().
+
+    python -m pytest -q tests
+
+Runs on a throwaway SQLite file; set TEST_DATABASE_URL to run against a scratch Postgres
+database instead (its tables are dropped and recreated).
+"""
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite+aiosqlite:///{_tmp.name}/rollups.db")
+
+from sqlalchemy import select
+from app.auth.token_cache import CurrentUser
+from app.db import models
+from app.db.session import Base, SessionLocal, engine
+from app.db.models import (User, UploadedFile, Concept, Question, QType, UserStats,
+                           QuestionStats, ConceptMastery, FileStats)
+from app.analytics import rollups
+from app.tests.router import submit_test, SubmitIn
+
+def _snapshot_rows(rows) -> list[tuple]:
+    return sorted(tuple(r) for r in rows)
+
+async def _snapshot() -> dict:
+    async with SessionLocal() as s:
+        return {
+            "users": _snapshot_rows((await s.execute(select(
+                UserStats.user_id, UserStats.tests_taken, UserStats.score_sum, UserStats.best_score,
+                UserStats.last_score, UserStats.last_test_at))).all()),
+            "questions": _snapshot_rows((await s.execute(select(
+                QuestionStats.question_id, QuestionStats.file_id, QuestionStats.attempts,
+                QuestionStats.correct))).all()),
+            "concepts": _snapshot_rows((await s.execute(select(
+                ConceptMastery.user_id, ConceptMastery.concept_id, ConceptMastery.attempts,
+                ConceptMastery.correct))).all()),
+            "files": _snapshot_rows((await s.execute(select(
+                FileStats.file_id, FileStats.attempts, FileStats.correct))).all()),
+        }
+
+async def _seed(n_questions: int = 4):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as s:
+        user = User(email="rollups@example.com", password_hash="x", name="rollups")
+        s.add(user)
+        await s.flush()
+        f = UploadedFile(user_id=user.id, filename="a.pdf", file_path="a.pdf", file_type="pdf")
+        s.add(f)
+        await s.flush()
+        concepts = [Concept(file_id=f.id, keyword=f"k{i}") for i in range(2)]
+        s.add_all(concepts)
+        await s.flush()
+        questions = [Question(concept_id=concepts[i % 2].id, question_type=QType.short,
+                              question_text=f"q{i}", correct_answer=f"a{i}") for i in range(n_questions)]
+        s.add_all(questions)
+        await s.commit()
+        return CurrentUser.from_user(user), [q.id for q in questions]
+
+async def _new_test(user: CurrentUser, qids: list[str], test_date: datetime) -> str:
+    async with SessionLocal() as s:
+        t = models.Test(user_id=user.id, test_date=test_date, total_questions=len(qids))
+        s.add(t)
+        await s.flush()
+        s.add_all([models.TestItem(test_id=t.id, question_id=q) for q in qids])
+        await s.commit()
+        return t.id
+
+async def _submit(user: CurrentUser, test_id: str, answers: dict[str, str]) -> float:
+    async with SessionLocal() as s:
+        body = SubmitIn(answers=[{"question_id": q, "answer": a} for q, a in answers.items()])
+        return (await submit_test(test_id, body, user=user, s=s))["score"]
+
+def _right(numbered):
+    return {q: f"a{i}" for i, q in numbered}
+
+async def _resubmits() -> tuple[dict, dict]:
+    user, qids = await _seed()
+    numbered = list(enumerate(qids))
+    day = datetime(2026, 10, 1)
+    a = await _new_test(user, qids, day)
+    b = await _new_test(user, qids, day + timedelta(days=1))
+    older = await _new_test(user, qids, day - timedelta(days=1))
+
+    assert await _submit(user, a, _right(numbered)) == 100.0
+    assert await _submit(user, b, {q: "wrong" for q in qids}) == 0.0
+    # resubmitting A lowers the best score; last stays with B, the newest test
+    assert await _submit(user, a, {q: "wrong" for q in qids}) == 0.0
+    # a partial resubmit only replaces the answers it sends
+    await _submit(user, b, _right(numbered[:2]))
+    # first submission of a test dated before the latest one
+    await _submit(user, older, _right(numbered[1:]))
+    await _submit(user, older, _right(numbered[:1]))
+
+    incremental = await _snapshot()
+    await rollups.backfill()
+    rebuilt = await _snapshot()
+    await engine.dispose()
+    return incremental, rebuilt
+
+def test_incremental_rollups_match_backfill_across_resubmits():
+    incremental, rebuilt = asyncio.run(_resubmits())
+    assert incremental == rebuilt
+    (_, taken, score_sum, best, last, last_at), = incremental["users"]
+    assert (taken, score_sum) == (3, 150.0)
+    assert (best, last, last_at) == (100.0, 50.0, datetime(2026, 10, 2))